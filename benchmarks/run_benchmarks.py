@@ -0,0 +1,268 @@
+"""
+Time the analyzer end to end against a stub of the GitHub and Jenkins APIs serving synthetic data.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --prs 1000 --latency-ms 20 --output benchmark.json
+    python -m benchmarks.run_benchmarks --prs 1000 --latency-ms 20 --baseline benchmark.json
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import github_pr_analyzer
+from benchmarks.stub_server import add_repository_arguments, create_stub_server
+from cache_store import STORE_BACKENDS, open_store
+from metrics_store import MetricsStore
+from request_cache import RequestCache
+
+REPOSITORY = "synthetic/repository"
+
+# In the order they run, each one after the stages before it
+STAGES = [
+    "get_pull_requests_cold",  # Every page is downloaded
+    "prefetch_cold",  # Every comment, event and test report is downloaded
+    "calculate_metrics_memory",  # Cached responses come from the memory tier
+    "print_metrics",
+    "get_pull_requests_revalidated",  # Every page is revalidated and answered with 304
+    "prefetch_warm",  # A new RequestCache finds everything in the store
+    "calculate_metrics_store",  # Cached responses are read and decoded from the store
+    "calculate_metrics_stored",  # Every metric is reused from the metrics store
+    "pipeline_cold",  # Listing, downloading and extracting overlapped, from a fresh cache
+]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def serve_stub(args, urls):
+    stub = create_stub_server(args)
+    urls.put(stub.url)
+    stub.serve_forever()
+
+
+@contextlib.contextmanager
+def stub_process(args):
+    """
+    Run the stub server in its own process so serving requests does not compete with the analyzer for the GIL.
+
+    Yields:
+    The URL of the stub.
+    """
+    urls = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_stub, args=(args, urls), daemon=True)
+    process.start()
+    try:
+        yield urls.get(timeout=600)
+    finally:
+        process.terminate()
+        process.join()
+
+
+class StageTimer(object):
+    """
+    Measures the wall time and the stub requests of each stage, silencing what the analyzer prints unless verbose.
+    """
+
+    def __init__(self, stub_url, verbose=False):
+        self.stub_url = stub_url
+        self.verbose = verbose
+        self.timings = {}
+        self.requests = {}
+
+    def stub_requests(self):
+        return sum(requests.get(f"{self.stub_url}/_stats").json().values())
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        requests_before = self.stub_requests()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if self.verbose else devnull):
+            start = time.perf_counter()
+            yield
+            elapsed = time.perf_counter() - start
+        self.timings[name] = elapsed
+        self.requests[name] = self.stub_requests() - requests_before
+        print(f"{name}: {elapsed:.3f}s, {self.requests[name]} requests", file=sys.stderr)
+
+
+def open_cache(args, cache_dir):
+    return RequestCache(
+        store=open_store(args.cache_backend, cache_dir),
+        memory_max_entries=args.cache_memory_entries,
+        memory_max_bytes=args.cache_memory_mb * 1024 * 1024,
+        telemetry=github_pr_analyzer.TELEMETRY,
+    )
+
+
+def run_once(args, stub_url):
+    """
+    Run every stage once against a fresh cache.
+
+    Returns:
+    A tuple of the seconds and the stub requests per stage, and the telemetry the analyzer collected.
+    """
+    work_dir = tempfile.mkdtemp(prefix="pr-analyzer-benchmark-")
+    cache_dir = os.path.join(work_dir, "cache")
+    output_dir = os.path.join(work_dir, "output")
+    os.makedirs(output_dir)
+
+    try:
+        github_pr_analyzer.configure(github_pr_analyzer.parse_args([
+            "--token", "benchmark",
+            "--github-api-url", stub_url,
+            "--github-graphql-url", f"{stub_url}/graphql",
+            "--data-source", args.data_source,
+            "--page-limit", str(args.prs // 100 + 1),
+            "--concurrency", str(args.concurrency),
+            "--non-github-delay-seconds", "0",
+            "--cache-backend", args.cache_backend,
+        ]))
+        timer = StageTimer(stub_url, args.verbose)
+
+        cache = open_cache(args, cache_dir)
+        with timer.stage("get_pull_requests_cold"):
+            pull_requests = github_pr_analyzer.get_pull_requests(REPOSITORY, cache)
+        with timer.stage("prefetch_cold"):
+            github_pr_analyzer.prefetch_pull_request_data(REPOSITORY, pull_requests, cache, args.concurrency)
+        with timer.stage("calculate_metrics_memory"):
+            pr_metrics = github_pr_analyzer.calculate_metrics(REPOSITORY, pull_requests, cache)
+        with timer.stage("print_metrics"):
+            github_pr_analyzer.print_metrics(pr_metrics, output_dir)
+        cache.store.close()
+
+        cache = open_cache(args, cache_dir)
+        with timer.stage("get_pull_requests_revalidated"):
+            pull_requests = github_pr_analyzer.get_pull_requests(REPOSITORY, cache)
+        with timer.stage("prefetch_warm"):
+            github_pr_analyzer.prefetch_pull_request_data(REPOSITORY, pull_requests, cache, args.concurrency)
+        cache.store.close()
+
+        cache = open_cache(args, cache_dir)
+        metrics_store = MetricsStore(os.path.join(work_dir, "metrics.sqlite"))
+        with timer.stage("calculate_metrics_store"):
+            github_pr_analyzer.calculate_metrics(REPOSITORY, pull_requests, cache, metrics_store=metrics_store)
+        with timer.stage("calculate_metrics_stored"):
+            github_pr_analyzer.calculate_metrics(REPOSITORY, pull_requests, cache, metrics_store=metrics_store)
+        metrics_store.close()
+        cache.store.close()
+
+        cache = open_cache(args, os.path.join(work_dir, "pipeline_cache"))
+        with timer.stage("pipeline_cold"):
+            github_pr_analyzer.stream_metrics(
+                REPOSITORY, github_pr_analyzer.pull_request_pages(REPOSITORY, cache), cache, concurrency=args.concurrency
+            )
+        cache.store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return timer.timings, timer.requests, github_pr_analyzer.TELEMETRY.snapshot()
+
+
+def summarize(runs):
+    """Reduce the seconds of every run to the min, median and max per stage."""
+    results = {}
+    for stage in STAGES:
+        seconds = [timings[stage] for timings, _, _ in runs]
+        results[stage] = {
+            "seconds": seconds,
+            "min": min(seconds),
+            "median": statistics.median(seconds),
+            "max": max(seconds),
+            "requests": runs[-1][1][stage],
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print how every stage changed against a baseline result file.
+
+    Returns:
+    The stages whose median got slower than the threshold allows.
+    """
+    regressions = []
+    for stage in STAGES:
+        before = baseline["results"].get(stage)
+        if before is None or before["median"] == 0:
+            continue
+        ratio = results[stage]["median"] / before["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(stage)
+            flag = "  REGRESSION"
+        print(f"{stage}: {before['median']:.3f}s -> {results[stage]['median']:.3f}s ({ratio:.2f}x){flag}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pull request analyzer against a stub API server.")
+    add_repository_arguments(parser)
+    parser.add_argument("--concurrency", help="Requests fetched in parallel", type=int, default=github_pr_analyzer.CONCURRENCY)
+    parser.add_argument("--data-source", choices=["rest", "graphql"], default="rest")
+    parser.add_argument("--cache-backend", choices=sorted(STORE_BACKENDS), default="files")
+    parser.add_argument("--cache-memory-entries", type=int, default=RequestCache.MEMORY_MAX_ENTRIES)
+    parser.add_argument("--cache-memory-mb", type=int, default=RequestCache.MEMORY_MAX_BYTES // (1024 * 1024))
+    parser.add_argument("--repeat", help="How often every stage is run, the median is reported", type=int, default=1)
+    parser.add_argument("--output", help="File the JSON results are written to, stdout when not given")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument(
+        "--regression-threshold",
+        help="Fraction a stage may get slower than the baseline before it counts as a regression",
+        type=float,
+        default=0.2,
+    )
+    parser.add_argument("--verbose", help="Keep what the analyzer prints", action="store_true")
+    args = parser.parse_args()
+
+    with stub_process(args) as stub_url:
+        runs = [run_once(args, stub_url) for _ in range(args.repeat)]
+    results = summarize(runs)
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {name: value for name, value in vars(args).items() if name not in ["output", "baseline", "verbose"]},
+        "peak_memory_mb": peak_memory_mb(),
+        "results": results,
+        "telemetry": runs[-1][2],  # Request latencies and cache outcomes of the last run
+    }
+
+    serialized = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(serialized + "\n")
+    else:
+        print(serialized)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.regression_threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
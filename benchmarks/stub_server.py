@@ -0,0 +1,260 @@
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from benchmarks.synthetic_data import SyntheticRepository
+
+PULLS_PATH = re.compile(r"^/repos/[^/]+/[^/]+/pulls$")
+ISSUE_PATH = re.compile(r"^/repos/[^/]+/[^/]+/issues/(\d+)/(comments|events)$")
+TEST_REPORT_PATH = re.compile(r"^/jenkins/job/gradle-check/(\d+)/+testReport/api/json$")
+GRAPHQL_ALIAS = re.compile(r"pr(\d+): pullRequest")
+
+
+class StubServer(object):
+    """
+    Serves a SyntheticRepository over HTTP the way the GitHub REST and GraphQL APIs and Jenkins do.
+
+    Pages carry Link headers and ETags, revalidated pages are answered with 304, and every response
+    is delayed by the configured latency. With a rate limit the X-RateLimit-* headers count down and
+    requests over the limit get a 403 until the window resets, like GitHub's primary rate limit.
+    """
+
+    def __init__(self, repository, latency_seconds=0.0, rate_limit=None, rate_limit_window_seconds=60.0, host="127.0.0.1", port=0):
+        """
+        Parameters:
+        - repository: The SyntheticRepository to serve.
+        - latency_seconds: Delay added to every response.
+        - rate_limit: Requests allowed per window, None for no limit.
+        - rate_limit_window_seconds: How long until the rate limit resets.
+        - host: Interface to listen on.
+        - port: Port to listen on, 0 picks a free one.
+        """
+        self.repository = repository
+        self.latency_seconds = latency_seconds
+        self.rate_limit = rate_limit
+        self.rate_limit_window_seconds = rate_limit_window_seconds
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_requests = 0
+
+        stub = self
+
+        class Handler(StubRequestHandler):
+            server_stub = stub
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        repository.jenkins_url = f"{self.url}/jenkins"
+        self._thread = None
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def take_request_budget(self):
+        """
+        Count a request against the rate limit.
+
+        Returns:
+        A dict with the rate limit headers and whether the request is allowed.
+        """
+        if self.rate_limit is None:
+            return {}, True
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= self.rate_limit_window_seconds:
+                self._window_start = now
+                self._window_requests = 0
+            allowed = self._window_requests < self.rate_limit
+            if allowed:
+                self._window_requests += 1
+            headers = {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(self.rate_limit - self._window_requests),
+                "X-RateLimit-Reset": str(int(self._window_start + self.rate_limit_window_seconds) + 1),
+            }
+            return headers, allowed
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive like the real APIs
+    disable_nagle_algorithm = True  # Headers and body are written separately, Nagle would delay the body
+    server_stub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, headers=None, page_url=None, has_next=False):
+        body = json.dumps(data).encode("utf-8")
+        headers = dict(headers or {})
+        etag = f'"{md5(body).hexdigest()}"'
+        headers["ETag"] = etag
+        if page_url is not None and has_next:
+            headers["Link"] = f'<{page_url}>; rel="next"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_body(304, b"", headers)
+        else:
+            self.send_body(200, body, headers)
+
+    def begin(self, endpoint):
+        stub = self.server_stub
+        stub.count(endpoint)
+        if stub.latency_seconds:
+            time.sleep(stub.latency_seconds)
+        headers, allowed = stub.take_request_budget()
+        if not allowed:
+            self.send_body(403, b'{"message": "API rate limit exceeded"}', headers)
+        return headers, allowed
+
+    def do_GET(self):
+        repository = self.server_stub.repository
+        parsed = urlparse(self.path)
+        query = {name: values[-1] for name, values in parse_qs(parsed.query).items()}
+        per_page = int(query.get("per_page", 30))
+        page = int(query.get("page", 1))
+
+        def next_page_url():
+            return f"{self.server_stub.url}{parsed.path}?{urlencode(dict(query, page=page + 1))}"
+
+        if parsed.path == "/_stats":
+            # Not counted, lets a benchmark in another process see how many requests each stage sent
+            self.send_body(200, json.dumps(self.server_stub.requests).encode("utf-8"))
+            return
+
+        if PULLS_PATH.match(parsed.path):
+            headers, allowed = self.begin("pulls")
+            if not allowed:
+                return
+            ordered = repository.by_updated if query.get("sort") == "updated" else repository.by_created
+            items = ordered[(page - 1) * per_page:page * per_page]
+            self.send_json(items, headers, next_page_url(), page * per_page < len(ordered))
+            return
+
+        match = ISSUE_PATH.match(parsed.path)
+        if match:
+            number, kind = int(match.group(1)), match.group(2)
+            headers, allowed = self.begin(kind)
+            if not allowed:
+                return
+            if number not in repository.by_number:
+                self.send_body(404, b'{"message": "Not Found"}', headers)
+                return
+            items = repository.comments(number) if kind == "comments" else repository.events(number)
+            if "since" in query:
+                items = [item for item in items if item["updated_at"] >= query["since"]]
+            page_items = items[(page - 1) * per_page:page * per_page]
+            self.send_json(page_items, headers, next_page_url(), page * per_page < len(items))
+            return
+
+        match = TEST_REPORT_PATH.match(parsed.path)
+        if match:
+            headers, allowed = self.begin("test_reports")
+            if not allowed:
+                return
+            self.send_json(repository.test_report(int(match.group(1))), headers)
+            return
+
+        self.send_body(404, b'{"message": "Not Found"}')
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if urlparse(self.path).path != "/graphql":
+            self.send_body(404, b'{"message": "Not Found"}')
+            return
+        headers, allowed = self.begin("graphql")
+        if not allowed:
+            return
+        repository = self.server_stub.repository
+        nodes = {
+            f"pr{number}": repository.graphql_pull_request(number) if number in repository.by_number else None
+            for number in (int(number) for number in GRAPHQL_ALIAS.findall(payload.get("query", "")))
+        }
+        self.send_body(200, json.dumps({"data": {"repository": nodes}}).encode("utf-8"), headers)
+
+
+def add_repository_arguments(parser):
+    parser.add_argument("--prs", help="Number of synthetic pull requests", type=int, default=1000)
+    parser.add_argument("--seed", help="Seed of the synthetic data", type=int, default=0)
+    parser.add_argument("--comments-per-pr", help="Average comments per pull request", type=int, default=8)
+    parser.add_argument("--events-per-pr", help="Average events per pull request", type=int, default=6)
+    parser.add_argument("--cases-per-report", help="Test cases in every test report", type=int, default=200)
+    parser.add_argument("--latency-ms", help="Latency the stub adds to every response", type=float, default=0)
+    parser.add_argument("--rate-limit", help="Requests the stub allows per rate limit window", type=int)
+    parser.add_argument(
+        "--rate-limit-window-seconds",
+        help="How long until the stub's rate limit resets",
+        type=float,
+        default=60,
+    )
+
+
+def create_stub_server(args, port=0):
+    """Generate the synthetic repository described by the parsed arguments and a stub serving it."""
+    repository = SyntheticRepository(
+        pr_count=args.prs,
+        seed=args.seed,
+        comments_per_pr=args.comments_per_pr,
+        events_per_pr=args.events_per_pr,
+        cases_per_report=args.cases_per_report,
+    )
+    return StubServer(
+        repository,
+        latency_seconds=args.latency_ms / 1000,
+        rate_limit=args.rate_limit,
+        rate_limit_window_seconds=args.rate_limit_window_seconds,
+        port=port,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic pull requests like the GitHub and Jenkins APIs.")
+    add_repository_arguments(parser)
+    parser.add_argument("--port", help="Port to listen on", type=int, default=8000)
+    args = parser.parse_args()
+
+    stub = create_stub_server(args, args.port)
+    print(f"Serving {args.prs} pull requests, run the analyzer with --github-api-url {stub.url} --github-graphql-url {stub.url}/graphql")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        stub.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import github_graphql
+
+BOTS = ["dependabot[bot]", "opensearch-trigger-bot[bot]", "codecov"]
+AUTHOR_ASSOCIATIONS = ["MEMBER", "COLLABORATOR", "CONTRIBUTOR", "FIRST_TIME_CONTRIBUTOR", "NONE"]
+EVENT_NAMES = [event for _, _, event in github_graphql.TIMELINE_EVENTS]
+GRAPHQL_TYPENAMES = {event: typename for typename, _, event in github_graphql.TIMELINE_EVENTS}
+
+
+def graphql_actor(user):
+    """A REST user as GraphQL reports it, apps are Bot actors whose login has no [bot] suffix."""
+    if user is None:
+        return None
+    if user["login"].endswith("[bot]"):
+        return {"__typename": "Bot", "login": user["login"][:-len("[bot]")]}
+    return {"__typename": "User", "login": user["login"]}
+
+
+def timestamp(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class SyntheticRepository(object):
+    """
+    Deterministic GitHub pull requests, comments, events and Jenkins test reports at any scale.
+
+    Pull requests are generated up front, their comments, events and the test reports of their builds
+    are generated from the seed whenever they are asked for, so memory only grows with the pull requests.
+    """
+
+    def __init__(
+        self,
+        pr_count=1000,
+        seed=0,
+        days=365,
+        contributors=200,
+        comments_per_pr=8,
+        events_per_pr=6,
+        gradle_failure_rate=0.3,
+        cases_per_report=200,
+        flaky_tests=50,
+        now=None,
+    ):
+        """
+        Parameters:
+        - pr_count: How many pull requests the repository has.
+        - seed: Seed of every random choice, the same seed generates the same data.
+        - days: Pull requests are created over this many days before now.
+        - contributors: How many distinct authors and commenters there are.
+        - comments_per_pr: Average number of comments on a pull request.
+        - events_per_pr: Average number of issue events on a pull request.
+        - gradle_failure_rate: Chance that a comment on a pull request is a failed gradle check.
+        - cases_per_report: Test cases in each Jenkins test report.
+        - flaky_tests: Size of the pool the failing test cases are drawn from.
+        - now: The newest time a pull request can be created, defaults to the start of the current day in UTC.
+        """
+        self.pr_count = pr_count
+        self.seed = seed
+        self.days = days
+        self.comments_per_pr = comments_per_pr
+        self.events_per_pr = events_per_pr
+        self.gradle_failure_rate = gradle_failure_rate
+        self.cases_per_report = cases_per_report
+        self.now = now or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.jenkins_url = "http://localhost/jenkins"
+
+        rng = random.Random(seed)
+        self.contributors = [
+            (f"contributor-{index}", rng.choice(AUTHOR_ASSOCIATIONS)) for index in range(contributors)
+        ]
+        self.flaky_tests = [f"org.opensearch.synthetic.Suite{index % 10}.testFlaky{index}" for index in range(flaky_tests)]
+        self.pull_requests = [self._pull_request(number) for number in range(1, pr_count + 1)]
+        self.by_number = {pr["number"]: pr for pr in self.pull_requests}
+        self.by_created = sorted(self.pull_requests, key=lambda pr: pr["created_at"], reverse=True)
+        self.by_updated = sorted(self.pull_requests, key=lambda pr: pr["updated_at"], reverse=True)
+
+    def _random(self, *parts):
+        # String seeds are hashed deterministically, unlike hash() of a tuple
+        return random.Random(":".join(str(part) for part in (self.seed,) + parts))
+
+    def _pull_request(self, number):
+        rng = self._random("pr", number)
+        # Numbers grow with the creation time like on GitHub
+        created = self.now - timedelta(days=self.days) + timedelta(days=self.days) * number / (self.pr_count + 1)
+        updated = created + timedelta(hours=rng.randint(1, 24 * 20))
+        merged = updated if rng.random() < 0.7 else None
+        if rng.random() < 0.05:
+            login, association = rng.choice(BOTS), "NONE"
+        else:
+            login, association = rng.choice(self.contributors)
+        return {
+            "number": number,
+            "title": f"Synthetic pull request {number}",
+            "state": "closed",
+            "user": {"login": login},
+            "author_association": association,
+            "body": "Description of the change. " * rng.randint(1, 20),
+            "created_at": timestamp(created),
+            "updated_at": timestamp(updated),
+            "closed_at": timestamp(updated),
+            "merged_at": timestamp(merged) if merged else None,
+        }
+
+    def _moments(self, rng, pr, count):
+        created = datetime.strptime(pr["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+        updated = datetime.strptime(pr["updated_at"], "%Y-%m-%dT%H:%M:%SZ")
+        span = (updated - created).total_seconds()
+        return sorted(created + timedelta(seconds=rng.uniform(0, span)) for _ in range(count))
+
+    def build_url(self, build):
+        return f"{self.jenkins_url}/job/gradle-check/{build}/"
+
+    def comments(self, number):
+        """The comments of a pull request like the REST /issues/{n}/comments response, oldest first."""
+        pr = self.by_number[number]
+        rng = self._random("comments", number)
+        comments = []
+        count = rng.randint(0, 2 * self.comments_per_pr)
+        for index, moment in enumerate(self._moments(rng, pr, count)):
+            draw = rng.random()
+            if draw < self.gradle_failure_rate:
+                # Builds are shared between pull requests so the same reports are linked again and again
+                build = rng.randint(1, max(1, self.pr_count // 2))
+                login, association = "github-actions[bot]", "NONE"
+                body = f":x: Gradle check result for {number}: [FAILURE]({self.build_url(build)})"
+            elif draw < self.gradle_failure_rate + 0.05:
+                login, association = rng.choice(BOTS), "NONE"
+                body = "Automated comment."
+            else:
+                login, association = rng.choice(self.contributors)
+                body = "Review comment. " * rng.randint(1, 30)
+            comments.append({
+                "id": number * 10000 + index,
+                "user": {"login": login},
+                "author_association": association,
+                "body": body,
+                "created_at": timestamp(moment),
+                "updated_at": timestamp(moment),
+            })
+        return comments
+
+    def events(self, number):
+        """The issue events of a pull request like the REST /issues/{n}/events response, oldest first."""
+        pr = self.by_number[number]
+        rng = self._random("events", number)
+        count = rng.randint(0, 2 * self.events_per_pr)
+        return [
+            {
+                "id": number * 10000 + index,
+                "node_id": f"E_{number}_{index}",
+                "event": rng.choice(EVENT_NAMES),
+                "actor": {"login": rng.choice(self.contributors)[0]},
+                "created_at": timestamp(moment),
+            }
+            for index, moment in enumerate(self._moments(rng, pr, count))
+        ]
+
+    def test_report(self, build):
+        """The Jenkins testReport of a build, a few cases failing out of the flaky pool."""
+        rng = self._random("report", build)
+        failing = set(rng.sample(self.flaky_tests, min(len(self.flaky_tests), rng.randint(1, 3))))
+        cases = [
+            {"className": test.rsplit(".", 1)[0], "name": test.rsplit(".", 1)[1], "status": "FAILED"}
+            for test in sorted(failing)
+        ]
+        cases += [
+            {"className": f"org.opensearch.synthetic.Suite{index % 10}", "name": f"testPasses{index}", "status": "PASSED"}
+            for index in range(self.cases_per_report - len(cases))
+        ]
+        rng.shuffle(cases)
+        suites = [{"cases": cases[index:index + 50]} for index in range(0, len(cases), 50)]
+        return {"_class": "hudson.tasks.junit.TestResult", "suites": suites}
+
+    def graphql_pull_request(self, number):
+        """A pull request node as the batched GraphQL query of github_graphql asks for it."""
+        comments = self.comments(number)
+        events = [event for event in self.events(number) if event["event"] in GRAPHQL_TYPENAMES]
+        return {
+            "number": number,
+            "authorAssociation": self.by_number[number]["author_association"],
+            "comments": {
+                "pageInfo": {"hasNextPage": len(comments) > 100},
+                "nodes": [
+                    {
+                        "databaseId": comment["id"],
+                        "author": graphql_actor(comment["user"]),
+                        "authorAssociation": comment["author_association"],
+                        "body": comment["body"],
+                        "createdAt": comment["created_at"],
+                        "updatedAt": comment["updated_at"],
+                    }
+                    for comment in comments[:100]
+                ],
+            },
+            "timelineItems": {
+                "pageInfo": {"hasNextPage": len(events) > 100},
+                "nodes": [
+                    {
+                        "__typename": GRAPHQL_TYPENAMES[event["event"]],
+                        "id": event["node_id"],
+                        "actor": graphql_actor(event["actor"]),
+                        "createdAt": event["created_at"],
+                    }
+                    for event in events[:100]
+                ],
+            },
+        }
@@ -0,0 +1,383 @@
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from hashlib import sha256
+
+try:
+    import fcntl
+except ImportError:  # Windows, the stores are then only safe to share between threads
+    fcntl = None
+
+class FileStore(object):
+    """
+    Stores every entry as its own file below the cache directory, the key is the relative path.
+
+    An entry is written to a temporary file next to it and renamed over it, so a process stopped
+    mid-write leaves the previous entry or none, never a truncated one.
+    """
+
+    TEMPORARY_SUFFIX = ".tmp"
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def read(self, key):
+        """Return the bytes stored for a key, None if there are none."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            return file.read()
+
+    def write(self, key, data):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Unique per writer, threads and processes can write the same key at once
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{os.path.basename(path)}.", suffix=self.TEMPORARY_SUFFIX
+        )
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def contains(self, key):
+        return os.path.exists(self.path(key))
+
+    def keys(self):
+        """Iterate over the stored keys."""
+        if not os.path.exists(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/")
+
+    def entries(self):
+        """Iterate over (key, size in bytes, time stored) for every entry."""
+        for key in self.keys():
+            stat = os.stat(self.path(key))
+            yield key, stat.st_size, stat.st_mtime
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def delete(self, key):
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(path)
+        directory = os.path.dirname(path)
+        if os.path.normpath(directory) != os.path.normpath(self.directory) and not os.listdir(directory):
+            os.rmdir(directory)
+
+    def clear(self):
+        for key in list(self.keys()):
+            self.delete(key)
+
+    def compact(self):
+        """Delete the temporary files of writes that were interrupted, deleting an entry already released its space."""
+        if not os.path.exists(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(".") and name.endswith(self.TEMPORARY_SUFFIX):
+                    os.remove(os.path.join(root, name))
+
+    def close(self):
+        pass
+
+
+class PackStore(object):
+    """
+    Appends compressed entries to a single data file and their offsets to a fixed width index file.
+
+    Each data record is a header with the key and payload lengths followed by the key and the zlib
+    compressed payload. The index file starts with a header holding a magic and its format version,
+    then each index entry is the sha256 of the key with the offset and length of its record and
+    when it was stored; the index is memory-mapped when the store is opened and the last entry for
+    a key wins, an entry with a zero length marks the key as deleted.
+    Entries are never rewritten in place, a crash can at most leave an incomplete tail which is
+    dropped on the next open. Space of deleted entries is only released by compact().
+
+    Several processes can share a store, appends hold an exclusive lock on a lock file so records do not
+    interleave. Each process only sees the entries that were indexed when it opened the store, entries
+    other processes add later are misses for it. compact() must not run while other processes use the store.
+    """
+
+    DATA_FILENAME = "cache.pack"
+    INDEX_FILENAME = "cache.idx"
+    LOCK_FILENAME = "cache.lock"
+
+    RECORD_HEADER = struct.Struct("<II")  # key length, compressed payload length
+    INDEX_HEADER = struct.Struct("<8sI")  # magic, index format version
+    INDEX_MAGIC = b"PRCACHE\0"
+    INDEX_VERSION = 2  # Bump when the index entry changes
+    INDEX_ENTRY = struct.Struct("<32sQId")  # sha256 of the key, record offset, record length, time stored
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, self.DATA_FILENAME)
+        self.index_path = os.path.join(directory, self.INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(directory, self.LOCK_FILENAME), "ab")
+        self._open()
+
+    @contextmanager
+    def _process_lock(self):
+        """Keep other processes sharing the store from appending at the same time."""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _open(self):
+        self._data = open(self.data_path, "ab+")
+        self._index_file = open(self.index_path, "ab+")
+        # Another process could be between appending a record and indexing it, which would look like a torn tail
+        with self._process_lock():
+            self._index = self._load_index()
+
+    def _load_index(self):
+        data_size = os.fstat(self._data.fileno()).st_size
+        index_size = os.fstat(self._index_file.fileno()).st_size
+        if index_size < self.INDEX_HEADER.size:
+            # A new index, or one whose header was not completely written
+            self._index_file.truncate(0)
+            self._index_file.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, self.INDEX_VERSION))
+            self._index_file.flush()
+            index_size = self.INDEX_HEADER.size
+        magic, version = self.INDEX_HEADER.unpack(os.pread(self._index_file.fileno(), self.INDEX_HEADER.size, 0))
+        if magic != self.INDEX_MAGIC or version != self.INDEX_VERSION:
+            raise ValueError(f"{self.index_path} is not a version {self.INDEX_VERSION} pack index, remove the store to start over")
+        index = {}
+        valid_size = self.INDEX_HEADER.size
+        if index_size >= self.INDEX_HEADER.size + self.INDEX_ENTRY.size:
+            with mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for position in range(self.INDEX_HEADER.size, index_size - self.INDEX_ENTRY.size + 1, self.INDEX_ENTRY.size):
+                    digest, offset, length, stored_at = self.INDEX_ENTRY.unpack_from(view, position)
+                    if offset + length > data_size:
+                        break  # The record was not fully written before the process stopped
+                    if length == 0:
+                        index.pop(digest, None)
+                    else:
+                        index[digest] = (offset, length, stored_at)
+                    valid_size = position + self.INDEX_ENTRY.size
+        if valid_size != index_size:
+            self._index_file.truncate(valid_size)
+        return index
+
+    @staticmethod
+    def digest(key):
+        return sha256(key.encode("utf-8")).digest()
+
+    def _read_record(self, offset, length):
+        record = os.pread(self._data.fileno(), length, offset)
+        key_length, payload_length = self.RECORD_HEADER.unpack_from(record)
+        key = record[self.RECORD_HEADER.size:self.RECORD_HEADER.size + key_length].decode("utf-8")
+        payload = record[self.RECORD_HEADER.size + key_length:]
+        return key, payload
+
+    def read(self, key):
+        """Return the bytes stored for a key, None if there are none."""
+        location = self._index.get(self.digest(key))
+        if location is None:
+            return None
+        stored_key, payload = self._read_record(location[0], location[1])
+        if stored_key != key:
+            return None  # The index does not belong to this data file, compaction was interrupted
+        return zlib.decompress(payload)
+
+    def write(self, key, data):
+        encoded_key = key.encode("utf-8")
+        payload = zlib.compress(data)
+        record = self.RECORD_HEADER.pack(len(encoded_key), len(payload)) + encoded_key + payload
+        digest = self.digest(key)
+        stored_at = time.time()
+        with self._lock, self._process_lock():
+            self._data.seek(0, os.SEEK_END)
+            offset = self._data.tell()
+            self._data.write(record)
+            self._data.flush()
+            # Only index the record once it is completely written
+            self._index_file.write(self.INDEX_ENTRY.pack(digest, offset, len(record), stored_at))
+            self._index_file.flush()
+            self._index[digest] = (offset, len(record), stored_at)
+
+    def contains(self, key):
+        return self.digest(key) in self._index
+
+    def keys(self):
+        """Iterate over the stored keys."""
+        for key, _, _ in self.entries():
+            yield key
+
+    def entries(self):
+        """Iterate over (key, size in bytes, time stored) for every entry."""
+        for offset, length, stored_at in list(self._index.values()):
+            key, _ = self._read_record(offset, length)
+            yield key, length, stored_at
+
+    def disk_usage(self):
+        return os.path.getsize(self.data_path) + os.path.getsize(self.index_path)
+
+    def delete(self, key):
+        digest = self.digest(key)
+        with self._lock, self._process_lock():
+            if self._index.pop(digest, None) is not None:
+                self._index_file.write(self.INDEX_ENTRY.pack(digest, 0, 0, time.time()))
+                self._index_file.flush()
+
+    def compact(self):
+        """Rewrite the data and index files with only the live entries."""
+        with self._lock:
+            with self._process_lock():
+                data_path = self.data_path + ".compact"
+                index_path = self.index_path + ".compact"
+                with open(data_path, "wb") as data, open(index_path, "wb") as index:
+                    index.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, self.INDEX_VERSION))
+                    for digest, (offset, length, stored_at) in sorted(self._index.items(), key=lambda item: item[1][0]):
+                        index.write(self.INDEX_ENTRY.pack(digest, data.tell(), length, stored_at))
+                        data.write(os.pread(self._data.fileno(), length, offset))
+                self._data.close()
+                self._index_file.close()
+                os.replace(data_path, self.data_path)
+                os.replace(index_path, self.index_path)
+            self._open()
+
+    def clear(self):
+        with self._lock:
+            with self._process_lock():
+                self._data.close()
+                self._index_file.close()
+                for path in [self.data_path, self.index_path]:
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._open()
+
+    def close(self):
+        self._data.close()
+        self._index_file.close()
+        self._lock_file.close()
+
+
+class SqliteStore(object):
+    """
+    Keeps zlib compressed entries in a single SQLite database.
+
+    The schema version is kept in the database's user_version.
+    """
+
+    FILENAME = "cache.sqlite"
+    SCHEMA_VERSION = 2  # Bump when the entries table changes
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Other processes sharing the database hold its write lock for a moment, wait for them instead of failing
+        self.connection = sqlite3.connect(os.path.join(directory, self.FILENAME), check_same_thread=False, timeout=60)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, data BLOB NOT NULL, stored_at REAL NOT NULL)"
+        )
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            self.connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        elif version != self.SCHEMA_VERSION:
+            raise ValueError(f"{self.FILENAME} in {directory} has schema version {version}, this version reads {self.SCHEMA_VERSION}")
+        self.connection.commit()
+
+    def read(self, key):
+        """Return the bytes stored for a key, None if there are none."""
+        with self._lock:
+            row = self.connection.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+        return zlib.decompress(row[0]) if row is not None else None
+
+    def write(self, key, data):
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (key, data, stored_at) VALUES (?, ?, ?)",
+                (key, zlib.compress(data), time.time()),
+            )
+            self.connection.commit()
+
+    def contains(self, key):
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    def keys(self):
+        """Iterate over the stored keys."""
+        with self._lock:
+            keys = [key for (key,) in self.connection.execute("SELECT key FROM entries")]
+        return iter(keys)
+
+    def entries(self):
+        """Iterate over (key, size in bytes, time stored) for every entry."""
+        with self._lock:
+            entries = self.connection.execute("SELECT key, length(data), stored_at FROM entries").fetchall()
+        return iter(entries)
+
+    def disk_usage(self):
+        return os.path.getsize(os.path.join(self.directory, self.FILENAME))
+
+    def delete(self, key):
+        with self._lock:
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM entries")
+            self.connection.commit()
+
+    def compact(self):
+        """Release the pages of deleted entries back to the file system."""
+        with self._lock:
+            self.connection.execute("VACUUM")
+
+    def close(self):
+        self.connection.close()
+
+
+STORE_BACKENDS = {
+    "files": FileStore,
+    "pack": PackStore,
+    "sqlite": SqliteStore,
+}
+
+
+def open_store(backend, directory):
+    """Open the cache store of the given backend name in a directory."""
+    return STORE_BACKENDS[backend](directory)
+
+
+def migrate_store(source, destination):
+    """
+    Copy every entry from one store into another and remove it from the source.
+
+    Returns:
+    The number of migrated entries.
+    """
+    keys = list(source.keys())
+    for key in keys:
+        destination.write(key, source.read(key))
+    for key in keys:
+        source.delete(key)
+    return len(keys)
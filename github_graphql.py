@@ -0,0 +1,137 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+BATCH_SIZE = 25  # Pull requests per query, GitHub limits the nodes a single query can touch
+
+# GraphQL timeline item type, its itemTypes filter value and the event name the REST issue events API uses for it
+TIMELINE_EVENTS = [
+    ("HeadRefForcePushedEvent", "HEAD_REF_FORCE_PUSHED_EVENT", "head_ref_force_pushed"),
+    ("LabeledEvent", "LABELED_EVENT", "labeled"),
+    ("UnlabeledEvent", "UNLABELED_EVENT", "unlabeled"),
+    ("ReviewRequestedEvent", "REVIEW_REQUESTED_EVENT", "review_requested"),
+    ("ClosedEvent", "CLOSED_EVENT", "closed"),
+    ("ReopenedEvent", "REOPENED_EVENT", "reopened"),
+    ("MergedEvent", "MERGED_EVENT", "merged"),
+    ("ReferencedEvent", "REFERENCED_EVENT", "referenced"),
+]
+REST_EVENT_NAMES = {typename: event for typename, _, event in TIMELINE_EVENTS}
+
+PULL_REQUEST_FIELDS = """
+    number
+    authorAssociation
+    comments(first: 100) {
+      pageInfo { hasNextPage }
+      nodes {
+        databaseId
+        author { __typename login }
+        authorAssociation
+        body
+        createdAt
+        updatedAt
+      }
+    }
+    timelineItems(first: 100, itemTypes: [%s]) {
+      pageInfo { hasNextPage }
+      nodes {
+        __typename
+%s
+      }
+    }
+""" % (
+    ", ".join(item_type for _, item_type, _ in TIMELINE_EVENTS),
+    "\n".join(
+        f"        ... on {typename} {{ id actor {{ __typename login }} createdAt }}"
+        for typename, _, _ in TIMELINE_EVENTS
+    ),
+)
+
+
+def build_query(pr_numbers):
+    """
+    Build a query fetching the comments and timeline of many pull requests, each one under an alias.
+    """
+    aliases = "\n".join(
+        f"  pr{number}: pullRequest(number: {int(number)}) {{{PULL_REQUEST_FIELDS}  }}"
+        for number in pr_numbers
+    )
+    return f"query($owner: String!, $name: String!) {{\n repository(owner: $owner, name: $name) {{\n{aliases}\n }}\n}}"
+
+
+def login_of(node):
+    """The login the REST API reports for a GraphQL actor."""
+    # Deleted accounts have no author, the REST API reports them as ghost
+    if not node:
+        return "ghost"
+    # GraphQL leaves the [bot] suffix off the login of an app, the bot filters match the REST login
+    if node.get("__typename") == "Bot":
+        return f"{node['login']}[bot]"
+    return node["login"]
+
+
+def normalize_comment(node):
+    """Shape a GraphQL comment like an item of the REST /issues/{n}/comments response."""
+    return {
+        "id": node["databaseId"],
+        "user": {"login": login_of(node["author"])},
+        "author_association": node["authorAssociation"],
+        "body": node["body"],
+        "created_at": node["createdAt"],
+        "updated_at": node["updatedAt"],
+    }
+
+
+def normalize_event(node):
+    """Shape a GraphQL timeline item like an item of the REST /issues/{n}/events response."""
+    return {
+        "node_id": node.get("id"),
+        "event": REST_EVENT_NAMES[node["__typename"]],
+        "actor": {"login": login_of(node.get("actor"))},
+        "created_at": node.get("createdAt"),
+    }
+
+
+def fetch_pull_request_activity(post, headers, owner, repo, pr_numbers, graphql_url=GRAPHQL_URL):
+    """
+    Fetch the comments and events of a batch of pull requests with a single GraphQL query.
+
+    Parameters:
+    - post: Function sending a POST request, taking the URL and the requests keyword arguments.
+    - headers: The headers to include in the request, typically including authorization.
+    - owner: GitHub owner of the repository.
+    - repo: GitHub repository.
+    - pr_numbers: The pull request numbers in this batch.
+    - graphql_url: The GraphQL endpoint.
+
+    Returns:
+    A dict from pull request number to a dict with the author association, the comments and the events.
+    A list is None when the pull request has more items than a single query returns, those have to be
+    fetched from the REST API. Pull requests the query failed for are left out.
+    """
+    response = post(
+        graphql_url,
+        headers=headers,
+        json={"query": build_query(pr_numbers), "variables": {"owner": owner, "name": repo}},
+    )
+    if response.status_code != 200:
+        logger.error("Error fetching GraphQL data: %s", response.status_code)
+        return {}
+    body = response.json()
+    for error in body.get("errors") or []:
+        logger.warning("GraphQL error: %s", error.get("message"))
+    repository = (body.get("data") or {}).get("repository") or {}
+
+    activity = {}
+    for number in pr_numbers:
+        node = repository.get(f"pr{number}")
+        if node is None:
+            continue
+        comments = node["comments"]
+        timeline = node["timelineItems"]
+        activity[number] = {
+            "author_association": node["authorAssociation"],
+            "comments": None if comments["pageInfo"]["hasNextPage"] else [normalize_comment(comment) for comment in comments["nodes"]],
+            "events": None if timeline["pageInfo"]["hasNextPage"] else [normalize_event(event) for event in timeline["nodes"]],
+        }
+    return activity
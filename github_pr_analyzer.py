@@ -1,29 +1,115 @@
 import argparse
+import copy
+import glob
+import json
+import logging
+import os
 import re
+import sys
 import time
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from urllib.parse import urlparse
 
 import numpy as np
 import pandas as pd
 import requests
-
+from requests.adapters import HTTPAdapter
+
+import github_graphql
+import jenkins_reports
+from rate_limiter import RequestScheduler
+from cache_store import STORE_BACKENDS, FileStore, migrate_store, open_store
+from history_store import HistoryStore
+from metrics_store import MetricsStore
+from prefetch_journal import PrefetchJournal
 from request_cache import RequestCache
+from telemetry import Telemetry
+from test_failure_index import TestFailureIndex
 
 # Constants
 HEADERS = {"Accept": "application/vnd.github.v3+json"}
 OUTPUT_DIR = "./output/"
 PAGE_COUNT_LIMIT = 5
+METRICS_VERSION = 2  # Bump when an extractor changes how an existing metric is computed
+FAILURE_WINDOW_DAYS = 30  # How far back the top test failures report looks by default
+CONCURRENCY = 4
+PREFETCH_INCOMPLETE_EXIT_STATUS = 3  # The prefetch mode stopped before every pull request was cached
 ARGS = None
 BOTS_TO_IGNORE = ["opensearch-trigger-bot[bot]", "codecov", "dependabot[bot]"]
+# The fields of a pull request the metrics use, everything else in the API payload is dropped while paging
+PULL_REQUEST_FIELDS = ["number", "user_login", "author_association", "created_at", "updated_at", "merged_at"]
+# Columns with few distinct values, stored as categoricals instead of one string object per row
+CATEGORICAL_COLUMNS = ["user_login", "author_association", "type_of_contribution"]
+
+logger = logging.getLogger(__name__)
+
+
+def create_session(pool_size=CONCURRENCY):
+    """
+    Create a session that keeps connections alive, with enough pooled connections per host for the worker threads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+SESSION = create_session()
+SCHEDULER = RequestScheduler()
+TELEMETRY = Telemetry()
+GITHUB_API_URL = "https://api.github.com"
+API_URL = GITHUB_API_URL  # The GitHub API root requests go to, set by configure()
+
+
+def create_scheduler(
+    concurrency=CONCURRENCY,
+    non_github_delay_seconds=1,
+    max_retries=4,
+    host_concurrency=None,
+    github_host=urlparse(GITHUB_API_URL).netloc,
+    telemetry=None,
+):
+    """
+    Create the scheduler pacing every request, GitHub adapts to its rate limit headers while other hosts
+    get at most one request per non_github_delay_seconds.
+
+    Parameters:
+    - host_concurrency: Optional dict from host to the concurrent requests allowed to it.
+    - github_host: The host serving the GitHub API.
+    - telemetry: Optional Telemetry every request is recorded in.
+    """
+    scheduler = RequestScheduler(
+        default_rate=1 / non_github_delay_seconds if non_github_delay_seconds > 0 else None,
+        default_concurrency=concurrency,
+        max_retries=max_retries,
+        telemetry=telemetry,
+    )
+    scheduler.configure_host(github_host, rate=None, concurrency=concurrency)
+    for host, limit in (host_concurrency or {}).items():
+        rate = None if host == github_host else scheduler.default_rate
+        scheduler.configure_host(host, rate=rate, concurrency=limit)
+    return scheduler
+
+
+def github_url(repository):
+    """The API URL of an owner/repo repository."""
+    return f"{API_URL}/repos/{repository}"
 
 
-def github_url():
-    return f"https://api.github.com/repos/{ARGS.github_owner}/{ARGS.github_repo}"
+def get_pull_requests(repository, cache:RequestCache=None):
+    """
+    Fetch pull requests of an owner/repo repository from the GitHub API.
+    """
+    return ingest_pull_requests(iter_pull_request_pages(repository, cache))
 
 
-def get_pull_requests():
+def iter_pull_request_pages(repository, cache:RequestCache=None):
     """
-    Fetch pull requests from the GitHub API.
+    Yield the pages of closed pull requests of an owner/repo repository, newest first, as they arrive.
     """
     params = {
         "state": "closed",
@@ -32,209 +118,762 @@ def get_pull_requests():
         "per_page": 100,
     }
 
-    return fetch_github_data(f"{github_url()}/pulls", params)
+    yield from iter_github_pages(f"{github_url(repository)}/pulls", params, cache, ARGS.page_limit)
 
 
-def fetch_github_data(url, params=None):
+def project_pull_request(pr):
     """
-    Fetches data from GitHub API handling pagination automatically.
+    Reduce a pull request from the GitHub API to PULL_REQUEST_FIELDS, flattening its user to user_login.
+
+    Pull requests that are already projected, like the ones of a stored list, are returned as they are.
+    """
+    if "user_login" in pr:
+        return pr
+    user = pr.get("user")
+    return {
+        "number": pr["number"],
+        "user_login": user["login"] if user else "ghost",  # GitHub shows deleted accounts as ghost
+        "author_association": pr.get("author_association"),
+        "created_at": pr.get("created_at"),
+        "updated_at": pr.get("updated_at"),
+        "merged_at": pr.get("merged_at"),
+    }
+
+
+def project_pages(pages):
+    """
+    Project every page of pull requests as it arrives, so no full payload outlives its page.
 
     Parameters:
-    - url: The initial URL to fetch data from.
-    - headers: The headers to include in the request, typically including authorization.
+    - pages: Iterable of pages of pull requests from the GitHub API.
+
+    Yields:
+    The projected pages.
+    """
+    count = 0
+    payload_bytes = projected_bytes = 0
+    for page_data in pages:
+        projected = [project_pull_request(pr) for pr in page_data]
+        if count == 0 and projected:
+            # Measured on the first page only, serializing every full page would cost more than it tells
+            payload_bytes = len(json.dumps(page_data)) / len(projected)
+            projected_bytes = len(json.dumps(projected)) / len(projected)
+        count += len(projected)
+        yield projected
+    if count:
+        logger.info(
+            "Ingested %d pull requests, about %.1f MB of JSON instead of %.1f MB for the full payloads",
+            count,
+            projected_bytes * count / (1024 * 1024),
+            payload_bytes * count / (1024 * 1024),
+        )
+
+
+def ingest_pull_requests(pages):
+    """
+    Project every page of pull requests as it arrives and return them all.
+    """
+    return [pr for page in project_pages(pages) for pr in page]
+
+
+def sync_pull_requests(repository, cache:RequestCache):
+    """
+    Bring the stored list of pull requests up to date and return it.
+
+    The first sync stores what get_pull_requests returns. Later syncs page through the most recently
+    updated pull requests and stop at the first page that reaches the stored high-water mark, so a
+    daily sync usually costs a single page.
+    """
+    stored = cache.load_pull_requests(repository)
+    if stored is None:
+        logger.info("No stored pull requests for %s, fetching the initial list...", repository)
+        pull_requests = get_pull_requests(repository, cache)
+        high_water_mark = max((pr["updated_at"] for pr in pull_requests), default=None)
+        cache.save_pull_requests(repository, high_water_mark, pull_requests)
+        return pull_requests
+
+    high_water_mark = stored["high_water_mark"]
+    stored_pull_requests = stored["pull_requests"]
+    known = {pr["number"]: pr["updated_at"] for pr in stored_pull_requests}
+    params = {
+        "state": "closed",
+        "sort": "updated",
+        "direction": "desc",
+        "per_page": 100,
+    }
+    # Without a stored pull request nothing stops the paging, it is bounded like the initial list
+    page_limit = ARGS.page_limit if not known else None
+    updated = {}
+    for page_data in iter_github_pages(f"{github_url(repository)}/pulls", params, cache, page_limit):
+        page_data = [project_pull_request(pr) for pr in page_data]
+        for pr in page_data:
+            if known.get(pr["number"]) != pr["updated_at"]:
+                updated[pr["number"]] = pr
+        if any(
+            known.get(pr["number"]) == pr["updated_at"]
+            or (high_water_mark is not None and pr["updated_at"] <= high_water_mark)
+            for pr in page_data
+        ):
+            break  # Every pull request after this one was already known when it was stored
+
+    merged = {pr["number"]: pr for pr in stored_pull_requests}
+    merged.update(updated)
+    pull_requests = sorted(merged.values(), key=lambda pr: pr["created_at"], reverse=True)
+    for pr in updated.values():
+        if high_water_mark is None or pr["updated_at"] > high_water_mark:
+            high_water_mark = pr["updated_at"]
+    logger.info("Synced %d updated pull requests, %d pull requests stored for %s", len(updated), len(pull_requests), repository)
+    cache.save_pull_requests(repository, high_water_mark, pull_requests)
+    return pull_requests
+
+
+def conditional_get(url, params=None, cache:RequestCache=None):
+    """
+    GET a GitHub URL, revalidating the previously stored response with its ETag / Last-Modified validators.
+
+    GitHub answers an unchanged resource with 304 Not Modified, which does not count against the rate limit,
+    the stored body is served in that case.
 
     Returns:
-    A list of items fetched from GitHub.
+    A tuple of the status code, the decoded body and the URL of the next page if there is one.
+    """
+    request_url = requests.Request("GET", url, params=params).prepare().url
+    stored = cache.load_validators(request_url) if cache is not None else None
+    headers = dict(HEADERS)
+    if stored is not None:
+        if stored["etag"]:
+            headers["If-None-Match"] = stored["etag"]
+        if stored["last_modified"]:
+            headers["If-Modified-Since"] = stored["last_modified"]
+
+    response = SCHEDULER.request(SESSION, "GET", url, headers=headers, params=params)
+    if response.status_code == 304 and stored is not None:
+        cache.revalidated(request_url)
+        return 200, stored["data"], stored["next"]
+    if response.status_code != 200:
+        return response.status_code, None, None
+
+    data = response.json()
+    next_url = response.links["next"]["url"] if "next" in response.links else None
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if cache is not None and (etag or last_modified):
+        cache.save_validators(request_url, etag, last_modified, data, next_url)
+    return response.status_code, data, next_url
+
+
+def iter_github_pages(url, params=None, cache:RequestCache=None, page_limit=None, raise_on_error=False):
+    """
+    Yield the pages of a paginated GitHub API resource, the caller can stop paging at any time.
+
+    Parameters:
+    - url: The initial URL to fetch data from.
+    - params: The query parameters for the first page, later pages carry them in their URL.
+    - cache: Where to keep validators so unchanged pages are revalidated instead of downloaded.
+    - page_limit: The maximum number of pages to fetch, None to fetch every page.
+    - raise_on_error: Raise requests.HTTPError when a page still fails after the retries, instead of
+      logging it and stopping as if it was the last page.
     """
-    all_data = []
     pages = 0
     has_more_pages = True
     while True:
-        print(f"Starting GET {url}...")
-        response = requests.get(url, headers=HEADERS, params=params)
-        if response.status_code != 200:
-            print(f"Error fetching data: {response.status_code}")
+        logger.debug("Starting GET %s...", url)
+        status_code, page_data, next_url = conditional_get(url, params, cache)
+        if status_code != 200:
+            if raise_on_error:
+                raise requests.HTTPError(f"Error fetching data from {url}: {status_code}")
+            logger.error("Error fetching data from %s: %s", url, status_code)
             break
-        page_data = response.json()
         if not page_data:
             break  # Break the loop if no more data are returned
-        all_data.extend(page_data)
+        yield page_data
 
-        if "next" not in response.links:
+        if next_url is None:
             has_more_pages = False
             break
 
         pages += 1
-        if pages >= ARGS.page_limit:
+        if page_limit is not None and pages >= page_limit:
             break
         # Keep paging
-        url = response.links["next"]["url"]  # Update the URL to fetch the next page
+        url = next_url  # Update the URL to fetch the next page
+        params = None
+
+    logger.debug("Load data from github from URL '%s' with %d pages.  Has more pages? %s", url, pages, has_more_pages)
+
+
+def fetch_github_data(url, params=None, cache:RequestCache=None):
+    """
+    Fetches data from GitHub API handling pagination automatically.
+
+    Parameters:
+    - url: The initial URL to fetch data from.
+    - params: The query parameters for the first page, later pages carry them in their URL.
+    - cache: Where to keep validators so unchanged pages are revalidated instead of downloaded.
+
+    Returns:
+    A list of items fetched from GitHub.
 
-    print(f"Load data from github from URL '{url}' with {pages} pages.  Has more pages? {has_more_pages}")
+    Raises requests.HTTPError when a page cannot be fetched, the items of the pages before it would
+    otherwise be cached as the whole resource and be the base of its next incremental sync.
+    """
+    all_data = []
+    for page_data in iter_github_pages(url, params, cache, ARGS.page_limit, raise_on_error=True):
+        all_data.extend(page_data)
     return all_data
 
 
-def fetch_pr_comments(cache:RequestCache, pr_number, last_modified_time):
-    url = f"{github_url()}/issues/{pr_number}/comments"
-    comments = cache.fetch(pr_number, url, last_modified_time, fetch_github_data)
+def fetch_pr_comments(cache:RequestCache, repository, pr_number, last_modified_time):
+    url = f"{github_url(repository)}/issues/{pr_number}/comments"
+    comments = cache.fetch(pr_number, url, last_modified_time, partial(sync_pr_comments, cache, pr_number))
     return comments
 
 
-def fetch_pr_events(cache:RequestCache, pr_number, last_modified_time):
-    url = f"{github_url()}/issues/{pr_number}/events"
-    events = cache.fetch(pr_number, url, last_modified_time, fetch_github_data)
+def fetch_pr_events(cache:RequestCache, repository, pr_number, last_modified_time):
+    url = f"{github_url(repository)}/issues/{pr_number}/events"
+    events = cache.fetch(pr_number, url, last_modified_time, partial(sync_pr_events, cache, pr_number))
     return events
 
 
-def fetch_test_results(cache:RequestCache, base_url, pr_number, last_modified_time):
-    url = f"{base_url}/testReport/api/json?tree=suites[cases[status,className,name]]"
-    test_results = cache.fetch(
-        pr_number, url, last_modified_time, fetch_json_data
-    )
+def merge_by_id(previous, fresh):
+    """
+    Merge newly fetched items into the previously synced ones, a fresh copy replaces an item with the same id.
+    """
+    merged = {item["id"]: item for item in previous}
+    merged.update((item["id"], item) for item in fresh)
+    return list(merged.values())
+
+
+def sync_pr_comments(cache:RequestCache, pr_number, url):
+    """
+    Fetch the comments of a pull request, only asking for the ones updated since the last synced snapshot.
+
+    Comments deleted after they were synced are not noticed, a fresh cache picks that up.
+    """
+    previous = cache.load_synced(pr_number, url)
+    # No validators on a full fetch, the synced snapshot already holds every page
+    if previous is None or any("id" not in comment for comment in previous):
+        return fetch_github_data(url, {"per_page": 100})
+
+    since = max((comment["updated_at"] for comment in previous), default=None)
+    if since is None:
+        return fetch_github_data(url, {"per_page": 100})
+    # No validators, the since parameter makes every one of these URLs unique
+    fresh = fetch_github_data(url, {"per_page": 100, "since": since})
+    logger.debug("Synced %d comments updated since %s for PR #%s", len(fresh), since, pr_number)
+    return sorted(merge_by_id(previous, fresh), key=lambda comment: (comment["created_at"], comment["id"]))
+
+
+def sync_pr_events(cache:RequestCache, pr_number, url):
+    """
+    Fetch the events of a pull request, only asking for the pages after the last synced snapshot.
+
+    Events are listed oldest first and never change, so the synced ones fill every page up to the last one.
+    """
+    per_page = 100
+    previous = cache.load_synced(pr_number, url)
+    if previous is None or any("id" not in event for event in previous):
+        return fetch_github_data(url, {"per_page": per_page})
+
+    page = len(previous) // per_page + 1
+    fresh = fetch_github_data(url, {"per_page": per_page, "page": page}, cache=cache)
+    logger.debug("Synced events from page %d for PR #%s", page, pr_number)
+    return sorted(merge_by_id(previous, fresh), key=lambda event: event["id"])
+
+
+def test_report_url(base_url):
+    return f"{base_url}/testReport/api/json?tree=suites[cases[status,className,name]]"
+
+
+def fetch_test_results(cache:RequestCache, base_url):
+    """
+    Return the names of the failed tests of a build, None when its report could not be read.
+    """
+    # The report of a finished build never changes, it is cached by URL alone and shared between pull requests
+    url = test_report_url(base_url)
+    test_results = cache.fetch_immutable(url, fetch_failed_tests)
     return test_results
 
 
-def fetch_json_data(url):
-    print(
-        f"Starting GET {url} after delay of {ARGS.non_github_delay_seconds} seconds ..."
+def fetch_failed_tests(url):
+    """
+    Stream a Jenkins test report and keep only the names of the failed cases, which is all that gets cached.
+
+    Returns None when the report could not be read so it is fetched again next time, a build without a report
+    stays without one and is returned as having no failures.
+    """
+    logger.debug("Starting GET %s...", url)
+    with SCHEDULER.request(SESSION, "GET", url, headers=HEADERS, params=None, stream=True) as response:
+        if response.status_code == 404:
+            return []
+        if response.status_code != 200:
+            return None
+        try:
+            return list(jenkins_reports.failed_test_names(response.iter_content(chunk_size=64 * 1024)))
+        except ValueError:
+            return None
+
+
+def is_failed_gradle_check(comment):
+    return (
+        comment["user"]["login"] in ["github-actions[bot]"]
+        and ":x: Gradle check result" in comment["body"]
     )
-    time.sleep(ARGS.non_github_delay_seconds)
-    response = requests.get(url, headers=HEADERS, params=None)
-    if response.status_code != 200:
-        return {}
-    try:
-        return response.json()
-    except:
-        return {}
 
 
-def calculate_metrics(pull_requests, cache:RequestCache):
+def failed_gradle_check_urls(comments):
     """
-    Calculate metrics for each pull request and aggregate them by week.
+    Find the Jenkins build URLs linked from failed gradle check comments.
     """
-    # Create a DataFrame from the pull request data
-    df = pd.DataFrame(pull_requests)
+    urls = (
+        extract_url(comment["body"])
+        for comment in comments
+        if is_failed_gradle_check(comment)
+    )
+    return [url for url in urls if url is not None]
 
-    # print(f'Pull request data source columns: {df.columns}')
 
-    # Ensure 'created_at' and 'merged_at' are datetime objects
-    df["created_at"] = pd.to_datetime(df["created_at"])
-    df["merged_at"] = pd.to_datetime(df["merged_at"])
+def prefetch_pull_request_data(repository, pull_requests, cache:RequestCache, concurrency=CONCURRENCY):
+    """
+    Warm the cache for every pull request so calculating metrics only reads cached data.
 
-    def categorize_contribution(row):
-        if row["user"]["login"] in BOTS_TO_IGNORE:
-            return "AUTOMATION"
-        if row["author_association"] == "FIRST_TIME_CONTRIBUTOR":
-            return "CONTRIBUTOR"
-        return row["author_association"]
-
-    df["type_of_contribution"] = df.apply(categorize_contribution, axis=1)
-
-    # Calculate business hours from open to merged
-    df["business_days_to_merge"] = df.apply(
-        lambda row: (
-            simplified_business_days(row["created_at"], row["merged_at"])
-            if pd.notnull(row["created_at"]) and pd.notnull(row["merged_at"])
-            else np.nan
-        ),
-        axis=1,
-    )
-
-    df["number_of_commenters"] = df.apply(
-        lambda row: (
-            len(
-                set(
-                    comment["user"]["login"]
-                    for comment in fetch_pr_comments(cache, row["number"], row["updated_at"])
-                    if comment["user"]["login"] not in BOTS_TO_IGNORE
-                )
-            )
-            if pd.notnull(row["updated_at"])
-            else np.nan
-        ),
-        axis=1,
-    )
-
-    df["number_of_comments"] = df.apply(
-        lambda row: (
-            len(
-                list(
-                    comment
-                    for comment in fetch_pr_comments(cache, row["number"], row["updated_at"])
-                    if comment["user"]["login"] not in BOTS_TO_IGNORE
-                )
-            )
-            if pd.notnull(row["updated_at"])
-            else np.nan
-        ),
-        axis=1,
-    )
+    Comments and events are fetched first, the test reports linked from the failed gradle
+    check comments can only be resolved once the comments are available.
 
-    def get_number_of_pushes(row):
-        if pd.isnull(row["updated_at"]):
-            return np.nan
+    Parameters:
+    - repository: The owner/repo the pull requests belong to.
+    - pull_requests: The pull requests as returned from the GitHub API.
+    - cache: The cache the responses are stored in.
+    - concurrency: How many requests are allowed to be in flight at once.
+    """
+    pull_requests = [pr for pr in pull_requests if pd.notnull(pr["updated_at"])]
 
-        return len(
-            list(
-                event
-                for event in fetch_pr_events(cache, row["number"], row["updated_at"])
-                if event["event"] in ["committed", "head_ref_force_pushed"]
-            )
-        )
+    def fetch_missing(keys):
+        missing = [key for key in keys if not cache.contains(key[0], key[1], key[2])]
+        logger.info("Prefetching %d of %d responses with concurrency %d...", len(missing), len(keys), concurrency)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Consume the results so errors from the workers are raised here
+            list(executor.map(lambda key: key[3](cache, repository, key[0], key[2]), missing))
 
-    df["number_of_pushes"] = df.apply(get_number_of_pushes, axis=1)
+    if ARGS.data_source == "graphql":
+        prefetch_with_graphql(repository, pull_requests, cache, concurrency)
 
-    def get_number_of_gradle_check_failures(row):
-        if pd.isnull(row["updated_at"]):
-            return np.nan
+    # With the GraphQL data source only the threads too long for a single query are still missing
+    github_keys = []
+    for pr in pull_requests:
+        github_keys.append((pr["number"], f"{github_url(repository)}/issues/{pr['number']}/comments", pr["updated_at"], fetch_pr_comments))
+        github_keys.append((pr["number"], f"{github_url(repository)}/issues/{pr['number']}/events", pr["updated_at"], fetch_pr_events))
+    fetch_missing(github_keys)
 
-        return len(
-            list(
-                comment
-                for comment in fetch_pr_comments(cache, row["number"], row["updated_at"])
-                if comment["user"]["login"] in ["github-actions[bot]"]
-                and ":x: Gradle check result" in comment["body"]
-            )
+    # Test reports are shared between pull requests, each build is only fetched once
+    failing_check_urls = {}
+    for pr in pull_requests:
+        comments = fetch_pr_comments(cache, repository, pr["number"], pr["updated_at"])
+        failing_check_urls.update(dict.fromkeys(failed_gradle_check_urls(comments)))
+    missing = [url for url in failing_check_urls if not cache.contains_immutable(test_report_url(url))]
+    logger.info("Prefetching %d of %d test reports with concurrency %d...", len(missing), len(failing_check_urls), concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda url: fetch_test_results(cache, url), missing))
+
+
+def prefetch_with_graphql(repository, pull_requests, cache:RequestCache, concurrency=CONCURRENCY):
+    """
+    Fetch the comments and events of many pull requests per GraphQL query and store them under their REST URLs.
+    """
+    missing = [
+        pr for pr in pull_requests
+        if not cache.contains(pr["number"], f"{github_url(repository)}/issues/{pr['number']}/comments", pr["updated_at"])
+        or not cache.contains(pr["number"], f"{github_url(repository)}/issues/{pr['number']}/events", pr["updated_at"])
+    ]
+    batches = [
+        missing[index:index + github_graphql.BATCH_SIZE]
+        for index in range(0, len(missing), github_graphql.BATCH_SIZE)
+    ]
+    logger.info("Prefetching %d pull requests in %d GraphQL queries with concurrency %d...", len(missing), len(batches), concurrency)
+
+    owner, repo = repository.split("/", 1)
+
+    def fetch_batch(batch):
+        activity = github_graphql.fetch_pull_request_activity(
+            partial(SCHEDULER.request, SESSION, "POST"),
+            HEADERS,
+            owner,
+            repo,
+            [pr["number"] for pr in batch],
+            ARGS.github_graphql_url,
         )
+        for pr in batch:
+            pr_activity = activity.get(pr["number"])
+            if pr_activity is None:
+                continue
+            if pr_activity["comments"] is not None:
+                cache.save_to_cache(pr["number"], f"{github_url(repository)}/issues/{pr['number']}/comments", pr_activity["comments"], pr["updated_at"])
+            if pr_activity["events"] is not None:
+                cache.save_to_cache(pr["number"], f"{github_url(repository)}/issues/{pr['number']}/events", pr_activity["events"], pr["updated_at"])
 
-    df["gradle_check_failures"] = df.apply(get_number_of_gradle_check_failures, axis=1)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fetch_batch, batches))
 
-    def filter_to_test_failures(test_results):
-        if not (isinstance(test_results, dict)) or len(test_results) != 2:
-            return []
 
-        all_cases = [
-            case for suite in test_results["suites"] for case in suite["cases"]
-        ]
-        failed_cases = [
-            f"{case['className']}.{case['name']}"
-            for case in all_cases
-            if case["status"] in ["FAILED", "REGRESSION"]
-        ]
-        return failed_cases
+def prefetch_pull_request(cache:RequestCache, repository, pr):
+    """
+    Cache the comments, events and linked test reports of one pull request.
 
-    def get_failing_tests(row):
-        if pd.isnull(row["updated_at"]):
-            return np.nan
+    Returns:
+    True when every test report was cached, a report that could not be read is not cached and is fetched again.
+    """
+    fetch_pr_events(cache, repository, pr["number"], pr["updated_at"])
+    comments = fetch_pr_comments(cache, repository, pr["number"], pr["updated_at"])
+    urls = failed_gradle_check_urls(comments)
+    for url in urls:
+        fetch_test_results(cache, url)
+    return all(cache.contains_immutable(test_report_url(url)) for url in urls)
 
-        failing_check_urls = list(
-            extract_url(comment["body"])
-            for comment in fetch_pr_comments(cache, row["number"], row["updated_at"])
-            if comment["user"]["login"] in ["github-actions[bot]"]
-            and ":x: Gradle check result" in comment["body"]
-        )
-        list_of_failing_tests = [
-            failure
-            for failing_check_url in failing_check_urls
-            for failure in filter_to_test_failures(
-                fetch_test_results(cache, failing_check_url, row["number"], row["updated_at"])
-            )
-        ]
-        return list_of_failing_tests
 
-    df["failing_tests"] = df.apply(get_failing_tests, axis=1)
+def resumable_prefetch(repository, pull_requests, cache:RequestCache, journal:PrefetchJournal, concurrency=CONCURRENCY, deadline=None):
+    """
+    Warm the cache for the pull requests the journal has not recorded as done, recording each one once all
+    of its responses are stored, until every one is done or the deadline passes.
+
+    Pull requests already being fetched when the deadline passes are finished, no new ones are started. A pull
+    request whose fetch fails or whose test reports could not all be cached is logged and left out of the
+    journal, so the next run tries it again.
+
+    Parameters:
+    - repository: The owner/repo the pull requests belong to.
+    - pull_requests: The projected pull requests to prefetch.
+    - journal: Where completed pull requests are checkpointed between runs.
+    - concurrency: How many pull requests are fetched in parallel.
+    - deadline: time.monotonic() value after which no more pull requests are started, None for no limit.
+
+    Returns:
+    The number of pull requests still to prefetch.
+    """
+    pull_requests = [pr for pr in pull_requests if pd.notnull(pr["updated_at"])]
+    journal.retain(PrefetchJournal.key(repository, pr) for pr in pull_requests)
+    pending = [pr for pr in pull_requests if not journal.done(PrefetchJournal.key(repository, pr))]
+    logger.info("Prefetching %d of %d pull requests, the journal has the others", len(pending), len(pull_requests))
+
+    def collect_oldest():
+        pr, future = in_flight.popleft()
+        try:
+            complete = future.result()
+        except Exception:
+            logger.exception("Prefetching PR #%s of %s failed, the next run tries it again", pr["number"], repository)
+            return 0
+        if not complete:
+            logger.warning("Not every test report of PR #%s of %s could be fetched, the next run tries it again", pr["number"], repository)
+            return 0
+        journal.record(PrefetchJournal.key(repository, pr))
+        return 1
+
+    in_flight = deque()  # (pr, future), oldest first
+    remaining = len(pending)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index in range(0, len(pending), 100):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            chunk = pending[index:index + 100]
+            if ARGS.data_source == "graphql":
+                try:
+                    prefetch_with_graphql(repository, chunk, cache, concurrency)
+                except Exception:
+                    logger.exception("GraphQL prefetch of %d pull requests failed, fetching them from the REST API", len(chunk))
+            for pr in chunk:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                if len(in_flight) >= 4 * concurrency:
+                    remaining -= collect_oldest()
+                in_flight.append((pr, executor.submit(prefetch_pull_request, cache, repository, pr)))
+        while in_flight:
+            remaining -= collect_oldest()
+    return remaining
+
+
+class CommentFacts(object):
+    """
+    What the extractors need to know about a comment, worked out once per comment.
+    """
+
+    def __init__(self, comment):
+        self.login = comment["user"]["login"]
+        self.ignored = self.login in BOTS_TO_IGNORE
+        self.failed_gradle_check = is_failed_gradle_check(comment)
+        self.failed_check_url = extract_url(comment["body"]) if self.failed_gradle_check else None
+        self.created_at = comment["created_at"]
+
+
+class MetricExtractor(object):
+    """
+    Accumulates metrics for a single pull request while its comments and events are walked once.
+
+    Subclasses list the columns they produce and are added to the walk with @register_extractor.
+    """
+
+    columns = ()
+
+    def __init__(self, cache:RequestCache, repository, pr_number, last_modified_time):
+        self.cache = cache
+        self.repository = repository
+        self.pr_number = pr_number
+        self.last_modified_time = last_modified_time
+
+    def on_comment(self, comment:CommentFacts):
+        pass
+
+    def on_event(self, event):
+        pass
+
+    def result(self):
+        """
+        Return a dict with a value for every column, None for the ones the extractor did not work out.
+
+        The dict also holds "incomplete": True when data the metrics depend on could not be fetched, such
+        metrics are reported but not stored, so they are computed again by the next run.
+        """
+        return dict.fromkeys(self.columns)
+
+
+METRIC_EXTRACTORS = []
+
+
+def register_extractor(extractor):
+    METRIC_EXTRACTORS.append(extractor)
+    return extractor
+
 
-    df["user_login"] = df["user"].apply(lambda x: x["login"])
+def metric_columns():
+    return [column for extractor in METRIC_EXTRACTORS for column in extractor.columns]
+
+
+def metrics_version():
+    """
+    Identify the extractors stored metrics were computed with, registering an extractor changes it.
+    """
+    return f"{METRICS_VERSION}:{','.join(metric_columns())}"
+
+
+def pending_pull_requests(pull_requests, metrics_store:MetricsStore=None):
+    """
+    Find the pull requests whose metrics are not stored for their current updated_at.
+    """
+    if metrics_store is None:
+        return pull_requests
+    stored = metrics_store.load(metrics_version())
+    return [
+        pr for pr in pull_requests
+        if pr["number"] not in stored or stored[pr["number"]][0] != pr["updated_at"]
+    ]
+
+
+@register_extractor
+class CommentersExtractor(MetricExtractor):
+    columns = ("number_of_commenters",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.commenters = set()
+
+    def on_comment(self, comment):
+        if not comment.ignored:
+            self.commenters.add(comment.login)
+
+    def result(self):
+        return {"number_of_commenters": len(self.commenters)}
+
+
+@register_extractor
+class CommentsExtractor(MetricExtractor):
+    columns = ("number_of_comments",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.comments = 0
+
+    def on_comment(self, comment):
+        if not comment.ignored:
+            self.comments += 1
+
+    def result(self):
+        return {"number_of_comments": self.comments}
+
+
+@register_extractor
+class PushesExtractor(MetricExtractor):
+    columns = ("number_of_pushes",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.pushes = 0
+
+    def on_event(self, event):
+        if event["event"] in ["committed", "head_ref_force_pushed"]:
+            self.pushes += 1
+
+    def result(self):
+        return {"number_of_pushes": self.pushes}
+
+
+@register_extractor
+class GradleCheckFailuresExtractor(MetricExtractor):
+    columns = ("gradle_check_failures",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.failures = 0
+
+    def on_comment(self, comment):
+        if comment.failed_gradle_check:
+            self.failures += 1
+
+    def result(self):
+        return {"gradle_check_failures": self.failures}
+
+
+@register_extractor
+class FailingTestsExtractor(MetricExtractor):
+    columns = ("failing_tests", "failing_test_builds")
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.failed_checks = []  # (build URL, time of the comment reporting it)
+
+    def on_comment(self, comment):
+        if comment.failed_check_url is not None:
+            self.failed_checks.append((comment.failed_check_url, comment.created_at))
+
+    def result(self):
+        # [test, build URL, time] for the TestFailureIndex, lists so they survive the metrics store as JSON
+        failing_test_builds = []
+        incomplete = False
+        for failing_check_url, failed_at in self.failed_checks:
+            failures = fetch_test_results(self.cache, failing_check_url)
+            if failures is None:
+                incomplete = True  # The report could not be read, the failures of this build are unknown
+                continue
+            failing_test_builds += [[failure, failing_check_url, failed_at] for failure in failures]
+        result = {
+            "failing_tests": [failure for failure, _, _ in failing_test_builds],
+            "failing_test_builds": failing_test_builds,
+        }
+        if incomplete:
+            result["incomplete"] = True
+        return result
+
+
+def extract_pull_request_metrics(cache:RequestCache, repository, pr_number, last_modified_time):
+    """
+    Walk the comments and events of a pull request once, feeding every registered extractor.
+
+    Returns:
+    A dict with a value for each of the metric_columns(), NaN when the pull request was never updated.
+    """
+    if pd.isnull(last_modified_time):
+        return {column: np.nan for column in metric_columns()}
+
+    extractors = [extractor(cache, repository, pr_number, last_modified_time) for extractor in METRIC_EXTRACTORS]
+    for comment in fetch_pr_comments(cache, repository, pr_number, last_modified_time):
+        facts = CommentFacts(comment)
+        for extractor in extractors:
+            extractor.on_comment(facts)
+    for event in fetch_pr_events(cache, repository, pr_number, last_modified_time):
+        for extractor in extractors:
+            extractor.on_event(event)
+
+    record = {}
+    for extractor in extractors:
+        record.update(extractor.result())
+    return record
+
+
+def pull_request_frame(pull_requests):
+    """
+    Build the DataFrame of pull requests the metrics start from, with datetime and categorical columns.
+
+    Parameters:
+    - pull_requests: Pull requests from the GitHub API, projected or not.
+
+    Returns:
+    A DataFrame with the PULL_REQUEST_FIELDS and type_of_contribution columns.
+    """
+    df = pd.DataFrame.from_records(
+        [project_pull_request(pr) for pr in pull_requests], columns=PULL_REQUEST_FIELDS
+    )
+
+    # Ensure 'created_at' and 'merged_at' are datetime objects
+    df["created_at"] = pd.to_datetime(df["created_at"])
+    df["merged_at"] = pd.to_datetime(df["merged_at"])
+
+    df["type_of_contribution"] = np.where(
+        df["user_login"].isin(BOTS_TO_IGNORE),
+        "AUTOMATION",
+        df["author_association"].replace("FIRST_TIME_CONTRIBUTOR", "CONTRIBUTOR"),
+    )
+
+    object_bytes = df[CATEGORICAL_COLUMNS].memory_usage(deep=True, index=False).sum()
+    df = df.astype({column: "category" for column in CATEGORICAL_COLUMNS})
+    categorical_bytes = df[CATEGORICAL_COLUMNS].memory_usage(deep=True, index=False).sum()
+    logger.info(
+        "Pull request frame takes %.1f MB, categorical columns saved %.1f MB",
+        df.memory_usage(deep=True).sum() / (1024 * 1024),
+        (object_bytes - categorical_bytes) / (1024 * 1024),
+    )
+    return df
+
+
+def calculate_metrics(repository, pull_requests, cache:RequestCache, holidays=None, metrics_store:MetricsStore=None):
+    """
+    Calculate metrics for each pull request of an owner/repo repository and aggregate them by week.
+
+    When a metrics store is given, pull requests whose stored metrics match their updated_at are not
+    recomputed and the metrics of the remaining ones are stored for the next run.
+    """
+    df = pull_request_frame(pull_requests)
+
+    version = metrics_version()
+    stored = metrics_store.load(version) if metrics_store is not None else {}
+    records = []
+    computed = []
+    for pr_number, updated_at in zip(df["number"], df["updated_at"]):
+        if pr_number in stored and stored[pr_number][0] == updated_at:
+            records.append(stored[pr_number][1])
+            continue
+        record = extract_pull_request_metrics(cache, repository, pr_number, updated_at)
+        records.append(record)
+        if pd.notnull(updated_at) and not record.get("incomplete"):
+            computed.append((pr_number, updated_at, record))
+    incomplete = log_incomplete_metrics(records)
+    logger.info("Computed metrics for %d pull requests, reused stored metrics for %d", len(computed) + incomplete, len(records) - len(computed) - incomplete)
+    if metrics_store is not None:
+        metrics_store.save(version, computed)
+
+    return metrics_frame(df, records, holidays)
+
+
+def log_incomplete_metrics(records):
+    incomplete = sum(1 for record in records if record.get("incomplete"))
+    if incomplete:
+        logger.warning("Test reports of %d pull requests could not be fetched, their metrics are not stored", incomplete)
+    return incomplete
+
+
+def metrics_frame(df, records, holidays=None):
+    """
+    Add the business days to merge and the extracted metrics to a pull_request_frame, indexed by created_at.
+
+    The incomplete column flags the pull requests whose metrics miss data that could not be fetched.
+
+    Parameters:
+    - df: The pull_request_frame of the pull requests.
+    - records: The metrics of every pull request, in the order of the frame.
+    - holidays: Optional dates not counted as business days.
+    """
+    # Calculate business days from open to merged
+    df["business_days_to_merge"] = business_days_between(df["created_at"], df["merged_at"], holidays)
+
+    extracted = pd.DataFrame.from_records(records, index=df.index, columns=metric_columns())
+    df[extracted.columns] = extracted
+    df["incomplete"] = [bool(record.get("incomplete")) for record in records]
 
     # Group by week and calculate aggregate metrics
     df.set_index("created_at", inplace=True)
@@ -242,6 +881,73 @@ def calculate_metrics(pull_requests, cache:RequestCache):
     return df
 
 
+def stream_metrics(repository, pages, cache:RequestCache, holidays=None, metrics_store:MetricsStore=None, concurrency=CONCURRENCY, max_in_flight=None):
+    """
+    Calculate the metrics of pull requests while they are still being listed, like calculate_metrics.
+
+    Every pull request of a page is handed to the worker threads as soon as the page arrives, a worker
+    fetches its comments, events and test reports and extracts its metrics, so paging and extraction
+    overlap. At most max_in_flight pull requests are worked on at a time, paging waits for the oldest
+    one when the bound is reached. Computed metrics are stored after every page.
+
+    Parameters:
+    - repository: The owner/repo the pull requests belong to.
+    - pages: Iterable of pages of projected pull requests.
+    - concurrency: How many pull requests are worked on in parallel.
+    - max_in_flight: Bound on the pull requests submitted but not collected, four per worker by default.
+
+    Returns:
+    A tuple of the per pull request metrics and the pull requests.
+    """
+    max_in_flight = max_in_flight or 4 * concurrency
+    version = metrics_version()
+    stored = metrics_store.load(version) if metrics_store is not None else {}
+    pull_requests = []
+    records = []
+    computed = []
+    in_flight = deque()  # (index in records, pr, future), oldest first
+    computed_count = 0
+
+    def collect_oldest():
+        index, pr, future = in_flight.popleft()
+        records[index] = future.result()
+        if pd.notnull(pr["updated_at"]) and not records[index].get("incomplete"):
+            computed.append((pr["number"], pr["updated_at"], records[index]))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for page in pages:
+            pending = [
+                pr for pr in page
+                if pr["number"] not in stored or stored[pr["number"]][0] != pr["updated_at"]
+            ]
+            if ARGS.data_source == "graphql":
+                prefetch_with_graphql(repository, [pr for pr in pending if pd.notnull(pr["updated_at"])], cache, concurrency)
+            pending_numbers = {pr["number"] for pr in pending}
+            for pr in page:
+                pull_requests.append(pr)
+                if pr["number"] not in pending_numbers:
+                    records.append(stored[pr["number"]][1])
+                    continue
+                records.append(None)
+                if len(in_flight) >= max_in_flight:
+                    collect_oldest()
+                future = executor.submit(extract_pull_request_metrics, cache, repository, pr["number"], pr["updated_at"])
+                in_flight.append((len(records) - 1, pr, future))
+            if metrics_store is not None and computed:
+                metrics_store.save(version, computed)
+            computed_count += len(computed)
+            computed = []
+        while in_flight:
+            collect_oldest()
+    if metrics_store is not None and computed:
+        metrics_store.save(version, computed)
+    computed_count += len(computed)
+    computed_count += log_incomplete_metrics(records)
+    logger.info("Computed metrics for %d pull requests, reused stored metrics for %d", computed_count, len(records) - computed_count)
+
+    return metrics_frame(pull_request_frame(pull_requests), records, holidays), pull_requests
+
+
 def extract_url(comment_string):
     pattern = r"\[.*?\]\((https?://[^\s]+)\)"
     match = re.search(pattern, comment_string)
@@ -254,11 +960,23 @@ def extract_url(comment_string):
         return None
 
 
-def print_metrics(raw_metrics):
+def print_metrics(raw_metrics, output_dir=OUTPUT_DIR, failure_index:TestFailureIndex=None, window_days=FAILURE_WINDOW_DAYS, repositories=None):
+    """
+    Print the weekly, per contribution type, per contributor and failing test reports and write them as CSVs.
+
+    When the metrics span repositories, with a repository column, pull requests are listed as owner/repo#number.
+
+    Parameters:
+    - failure_index: The TestFailureIndex the top test failures are queried from, one is built in memory
+      from the failing_test_builds of raw_metrics when not given.
+    - window_days: How many days back failures count towards the top test failures.
+    - repositories: Only count the failures of these owner/repo repositories in failure_index.
+    """
     pd.set_option("display.float_format", "{:,.1f}".format)
 
+    # The grouped columns are categoricals, only the combinations that occur are reported
     weekly_metrics = (
-        raw_metrics.groupby("type_of_contribution")
+        raw_metrics.groupby("type_of_contribution", observed=True)
         .resample("W")
         .agg(
             {
@@ -272,13 +990,13 @@ def print_metrics(raw_metrics):
     weekly_metrics = weekly_metrics.reset_index()
     weekly_metrics["created_at"] = weekly_metrics["created_at"].dt.strftime("%Y-%m-%d")
 
-    weekly_metrics_csv = OUTPUT_DIR + "business_days_to_merge_by_week.csv"
-    print(f"Writing weekly_metrics metrics to {weekly_metrics_csv}")
+    weekly_metrics_csv = os.path.join(output_dir, "business_days_to_merge_by_week.csv")
+    logger.info("Writing weekly_metrics metrics to %s", weekly_metrics_csv)
     weekly_metrics.to_csv(weekly_metrics_csv, index=False)
     print(weekly_metrics)
 
     prs_by_type_of_contribution_metrics = (
-        raw_metrics.groupby("type_of_contribution")
+        raw_metrics.groupby("type_of_contribution", observed=True)
         .agg(
             {
                 "number": "size",
@@ -291,11 +1009,11 @@ def print_metrics(raw_metrics):
         .reset_index()
     )
     print(prs_by_type_of_contribution_metrics)
-    prs_by_type_of_contribution_metrics_csv = OUTPUT_DIR + "pull_requests_metrics_by_type_of_contribution.csv"
+    prs_by_type_of_contribution_metrics_csv = os.path.join(output_dir, "pull_requests_metrics_by_type_of_contribution.csv")
     prs_by_type_of_contribution_metrics.to_csv(prs_by_type_of_contribution_metrics_csv, index=False)
 
     contributor_metrics = (
-        raw_metrics.groupby(["type_of_contribution", "user_login"])
+        raw_metrics.groupby(["type_of_contribution", "user_login"], observed=True)
         .agg(
             {
                 "number": "size",
@@ -313,98 +1031,308 @@ def print_metrics(raw_metrics):
     )
     with pd.option_context("display.max_rows", 10):
         print(contributor_metrics)
-    contributor_metrics_csv = OUTPUT_DIR + "pull_request_metrics_by_contributor_metrics.csv"
+    contributor_metrics_csv = os.path.join(output_dir, "pull_request_metrics_by_contributor_metrics.csv")
     contributor_metrics.to_csv(contributor_metrics_csv, index=False)
 
-    # Capture test failures within the past 30 days
-    one_month_ago = datetime.now() - timedelta(days=30)
-    failing_test_exploded = raw_metrics.explode("failing_tests").reset_index()
-    failing_test_exploded["created_at_date"] = pd.to_datetime(
-        failing_test_exploded["created_at"]
-    ).dt.tz_localize(None)
-    failing_test_exploded = failing_test_exploded[
-        failing_test_exploded["created_at_date"] >= one_month_ago
+    if failure_index is None:
+        failure_index = TestFailureIndex(":memory:")
+        failure_index.update(raw_metrics)
+    # Capture test failures within the window
+    since = (datetime.now(timezone.utc) - timedelta(days=window_days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    top_test_impacting_prs = failure_index.top_tests(
+        since=since,
+        limit=20,
+        min_prs=2,
+        repositories=repositories,
+        label_repositories="repository" in raw_metrics.columns,
+    )  # pr_numbers comes last since it takes up so much space
+
+    top_test_impacting_prs_csv = os.path.join(output_dir, "top_test_failures.csv")
+    logger.info("Writing top test impacting metrics to %s", top_test_impacting_prs_csv)
+    top_test_impacting_prs.to_csv(top_test_impacting_prs_csv, index=False)
+    print(top_test_impacting_prs)
+
+
+def business_days_between(start, end, holidays=None):
+    """
+    Calculate business days between two datetime columns assuming 8 business hours per weekday.
+
+    The first day counts as a full business day and every weekday up to, but not including, the last
+    day is added. When both fall on the same business day the elapsed hours are used, capped at 8.
+
+    Parameters:
+    - start: Series of datetimes the interval starts at.
+    - end: Series of datetimes the interval ends at.
+    - holidays: Optional list of dates that are not counted as business days.
+
+    Returns:
+    A float Series aligned with start, NaN where either side is missing.
+    """
+    holidays = np.array(holidays if holidays is not None else [], dtype="datetime64[D]")
+    valid = (start.notna() & end.notna()).to_numpy()
+    start_times = start.to_numpy(dtype="datetime64[ns]")[valid]
+    end_times = end.to_numpy(dtype="datetime64[ns]")[valid]
+    start_days = start_times.astype("datetime64[D]")
+    end_days = end_times.astype("datetime64[D]")
+
+    same_day_hours = np.minimum((end_times - start_times) // np.timedelta64(1, "h"), 8)
+    same_day = np.where(np.is_busday(start_days, holidays=holidays), same_day_hours / 8, 0.0)
+    multiple_days = np.busday_count(start_days, end_days, holidays=holidays)
+
+    days = np.full(len(start), np.nan)
+    days[valid] = np.where(start_days == end_days, same_day, multiple_days)
+    return pd.Series(days, index=start.index)
+
+
+def load_holidays(holidays_file):
+    """
+    Read holidays from a file with one YYYY-MM-DD date per line, lines starting with # are ignored.
+    """
+    with open(holidays_file) as file:
+        return [
+            line.strip()
+            for line in file
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+def load_pr_numbers(default_repository):
+    """
+    Read the pull requests written by save_pr_numbers, None if they were never saved.
+
+    Parameters:
+    - default_repository: The owner/repo of a line holding only a number, as written before lines named
+      their repository.
+
+    Returns:
+    A set of (owner/repo, number) tuples.
+    """
+    pr_numbers_file = f"{OUTPUT_DIR}pr_numbers.txt"
+    if not os.path.exists(pr_numbers_file):
+        return None
+    pull_requests = set()
+    with open(pr_numbers_file) as prs_file:
+        for line in prs_file:
+            if not line.strip():
+                continue
+            repository, _, number = line.strip().rpartition("#")
+            pull_requests.add((repository or default_repository, int(number)))
+    return pull_requests
+
+def save_pr_numbers(pull_requests):
+    """
+    Write the pull requests being analyzed as one owner/repo#number per line, sorted so the file only changes
+    when the pull requests do, CI keys the request cache by it.
+
+    Parameters:
+    - pull_requests: Iterable of (owner/repo, number) tuples.
+    """
+    with open(f"{OUTPUT_DIR}pr_numbers.txt", "w") as prs_file:
+        prs_file.writelines(f"{repository}#{number}\n" for repository, number in sorted(set(pull_requests)))
+
+
+def pull_request_urls(pull_requests):
+    """The comments and events URLs of (owner/repo, number) pull requests, the URLs their cache entries are kept under."""
+    return [
+        f"{github_url(repository)}/issues/{number}/{resource}"
+        for repository, number in pull_requests
+        for resource in ["comments", "events"]
     ]
 
-    failures_by_prs = (
-        failing_test_exploded.groupby("failing_tests")["number"]
-        .apply(list)
-        .reset_index(name="pr_numbers")
-    )
-    failures_by_prs["unique_pr_count"] = failures_by_prs["pr_numbers"].apply(
-        lambda x: len(set(x))
-    )
-    failures_by_prs["total_fail_count"] = failures_by_prs["pr_numbers"].apply(
-        lambda x: len(x)
-    )
-    failures_by_prs["pr_numbers"] = failures_by_prs["pr_numbers"].apply(
-        lambda pr_list: list(set(["#" + str(pr) for pr in pr_list]))
+
+def list_pull_requests(repository, cache:RequestCache):
+    return sync_pull_requests(repository, cache) if ARGS.sync_pull_requests else get_pull_requests(repository, cache)
+
+
+def pull_request_pages(repository, cache:RequestCache):
+    """
+    Yield the pull requests of a repository page by page, projected, for stream_metrics.
+
+    A synced list is brought up to date first, that usually costs a single page.
+    """
+    if ARGS.sync_pull_requests:
+        pull_requests = sync_pull_requests(repository, cache)
+        for index in range(0, len(pull_requests), 100):
+            yield pull_requests[index:index + 100]
+    else:
+        yield from project_pages(iter_pull_request_pages(repository, cache))
+
+
+def open_failure_index(repository):
+    failure_index = TestFailureIndex(ARGS.test_failure_index)
+    if ARGS.recompute_metrics:
+        failure_index.clear(repository)
+    return failure_index
+
+
+def open_cache():
+    return RequestCache(
+        store=open_store(ARGS.cache_backend, RequestCache.CACHE_DIR),
+        memory_max_entries=ARGS.cache_memory_entries,
+        memory_max_bytes=ARGS.cache_memory_mb * 1024 * 1024,
+        telemetry=TELEMETRY,
     )
-    top_test_impacting_prs = failures_by_prs[
-        failures_by_prs["unique_pr_count"] >= 2
-    ].nlargest(20, "unique_pr_count")
 
-    # Make sure the pr_numbers column is last since it takes up so much space
-    columns_order = [col for col in top_test_impacting_prs.columns if col != 'pr_numbers'] + ['pr_numbers']
-    top_test_impacting_prs = top_test_impacting_prs[columns_order]
 
-    top_test_impacting_prs_csv = OUTPUT_DIR + "top_test_failures.csv"
-    print(f"Writing top test impacting metrics to {top_test_impacting_prs_csv}")
-    top_test_impacting_prs.to_csv(top_test_impacting_prs_csv, index=False)
-    print(top_test_impacting_prs)
+def prefetch_repository(repository, cache:RequestCache):
+    """
+    Warm the cache for the pull requests find_pull_requests saved, resuming where an earlier prefetch stopped.
+
+    Returns:
+    The number of pull requests still to prefetch.
+    """
+    pr_numbers = load_pr_numbers(repository)
+    if pr_numbers is None:
+        logger.info("No %spr_numbers.txt found, run the find_pull_requests mode first", OUTPUT_DIR)
+        return 0
+    deadline = time.monotonic() + ARGS.time_budget_minutes * 60 if ARGS.time_budget_minutes is not None else None
+    with TELEMETRY.stage("list"):
+        pull_requests = [pr for pr in list_pull_requests(repository, cache) if (repository, pr["number"]) in pr_numbers]
+    journal = PrefetchJournal(ARGS.prefetch_journal)
+    try:
+        with TELEMETRY.stage("prefetch"):
+            remaining = resumable_prefetch(repository, pull_requests, cache, journal, ARGS.concurrency, deadline)
+    finally:
+        journal.close()
+    if remaining:
+        logger.info("%d pull requests are not prefetched yet, run the prefetch mode again to continue", remaining)
+    else:
+        logger.info("Prefetched every pull request")
+    return remaining
 
 
-def simplified_business_hours(start, end):
+def analyze_repository(repository, cache:RequestCache, metrics_store_path, output_dir=OUTPUT_DIR):
     """
-    Calculate business hours assuming 8 business hours per weekday between start and end datetime objects.
+    List the pull requests of an owner/repo repository, compute their metrics and write its reports.
+
+    Returns:
+    A tuple of the per pull request metrics and the pull requests.
     """
-    # Count each day from start to end
-    current_day = start.date()
-    end_day = end.date()
+    holidays = load_holidays(ARGS.holidays_file) if ARGS.holidays_file else None
+    metrics_store = MetricsStore(metrics_store_path)
+    if ARGS.recompute_metrics:
+        metrics_store.clear()
+    if ARGS.sequential:
+        with TELEMETRY.stage("list"):
+            pull_requests = list_pull_requests(repository, cache)
+        with TELEMETRY.stage("prefetch"):
+            prefetch_pull_request_data(repository, pending_pull_requests(pull_requests, metrics_store), cache, ARGS.concurrency)
+        with TELEMETRY.stage("metrics"):
+            pr_metrics = calculate_metrics(repository, pull_requests, cache, holidays, metrics_store)
+    else:
+        with TELEMETRY.stage("pipeline"):
+            pr_metrics, pull_requests = stream_metrics(
+                repository,
+                pull_request_pages(repository, cache),
+                cache,
+                holidays,
+                metrics_store,
+                ARGS.concurrency,
+                ARGS.max_in_flight,
+            )
+    metrics_store.close()
+    failure_index = open_failure_index(repository)
+    with TELEMETRY.stage("reports"):
+        indexed = failure_index.update(pr_metrics, repository)
+        logger.info("Indexed the failing tests of %d pull requests", indexed)
+        print_metrics(pr_metrics, output_dir, failure_index, ARGS.failure_window_days, [repository])
+    failure_index.close()
+    return pr_metrics, pull_requests
 
-    total_business_hours = 0
 
-    while current_day <= end_day:
-        if start.weekday() < 5:  # Monday to Friday are considered weekdays
-            # For the first day, add hours based on the time of day, assuming 8 hours per day
-            if current_day == start.date():
-                # If it starts on a weekday, assume it's a full business day
-                total_business_hours += 8
-            # For the last day, only add the remaining hours if it's the same day
-            elif current_day == end.date():
-                # Subtract the start day hours if end is on the same day
-                if start.date() == end.date():
-                    total_business_hours -= 8  # Remove the full day added initially
-                    # Add the actual hours from start to end on the same day
-                    hours = (end - start).seconds // 3600
-                    total_business_hours += hours
-            else:
-                # Any full day in between is considered a full business day
-                total_business_hours += 8
-        current_day += timedelta(days=1)  # Move to the next day
+def repository_slug(repository):
+    return repository.replace("/", "_")
 
-    # Adjust for the start and end being on the same day but outside business hours
-    if start.date() == end.date() and start.weekday() < 5:
-        # If both start and end are on the same day, calculate the difference
-        hours = (end - start).seconds // 3600
-        total_business_hours = min(hours, 8)  # Ensure it doesn't exceed a business day
 
-    return total_business_hours
+def init_repository_worker(args):
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s[%(process)d]: %(message)s")
+    configure(args)
 
 
-def simplified_business_days(start, end):
-    return simplified_business_hours(start, end) / 8
+def analyze_repository_worker(repository):
+    """
+    Analyze one repository in a worker process, each one gets its own metrics store and report directory.
 
-def save_pr_numbers(pull_requests):
-    pr_numbers = set()
-    for pr in pull_requests:
-        pr_numbers.add(str(pr['number']) + '\n')
-    with open(f"{OUTPUT_DIR}pr_numbers.txt", "w") as prs_file:
-        prs_file.writelines(pr_numbers)
+    Returns:
+    A tuple of the per pull request metrics with a repository column, the pull request numbers and the
+    telemetry recorded while analyzing it.
+    """
+    logger.info("Analyzing %s...", repository)
+    output_dir = os.path.join(OUTPUT_DIR, repository_slug(repository))
+    os.makedirs(output_dir, exist_ok=True)
+    metrics_store_path = f"{os.path.splitext(ARGS.metrics_store)[0]}_{repository_slug(repository)}.sqlite"
+    cache = open_cache()
+    try:
+        pr_metrics, pull_requests = analyze_repository(repository, cache, metrics_store_path, output_dir)
+    finally:
+        cache.store.close()
+    pr_metrics["repository"] = repository
+    telemetry = TELEMETRY.snapshot()
+    TELEMETRY.reset()
+    return pr_metrics, [pr["number"] for pr in pull_requests], telemetry
 
-def main():
+
+def print_repository_metrics(raw_metrics, output_dir=OUTPUT_DIR):
+    """
+    Print and write how the repositories compare to each other.
+    """
+    repository_metrics = (
+        raw_metrics.groupby("repository", observed=True)
+        .agg(
+            {
+                "number": "size",
+                "business_days_to_merge": "mean",
+                "number_of_commenters": "mean",
+                "number_of_comments": "mean",
+                "number_of_pushes": "mean",
+                "gradle_check_failures": "sum",
+            }
+        )
+        .sort_values(by="number", ascending=False)
+        .reset_index()
+    )
+    print(repository_metrics)
+    repository_metrics_csv = os.path.join(output_dir, "pull_requests_metrics_by_repository.csv")
+    logger.info("Writing repository metrics to %s", repository_metrics_csv)
+    repository_metrics.to_csv(repository_metrics_csv, index=False)
+
+
+def analyze_repositories(repositories, args, workers):
+    """
+    Analyze many repositories in worker processes sharing the cache store, then write org-wide rollups of
+    their reports next to the per repository ones.
+
+    Parameters:
+    - repositories: The owner/repo repositories to analyze.
+    - args: The parsed arguments the workers are configured with, including the token.
+    - workers: How many repositories are analyzed at once.
+    """
+    frames = []
+    pr_numbers = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_repository_worker, initargs=(args,)) as executor:
+        for repository, (pr_metrics, numbers, telemetry) in zip(repositories, executor.map(analyze_repository_worker, repositories)):
+            logger.info("Analyzed %d pull requests of %s", len(numbers), repository)
+            frames.append(pr_metrics)
+            pr_numbers.extend((repository, number) for number in numbers)
+            TELEMETRY.merge(telemetry)
+
+    # Every repository's pull requests, so gc keeps the entries of all of them
+    save_pr_numbers(pr_numbers)
+    with TELEMETRY.stage("rollup"):
+        # Each repository has its own categories, concat turns columns whose categories differ back into objects
+        raw_metrics = pd.concat(frames).astype({column: "category" for column in CATEGORICAL_COLUMNS})
+        failure_index = TestFailureIndex(args.test_failure_index)
+        print_metrics(raw_metrics, OUTPUT_DIR, failure_index, args.failure_window_days, repositories)
+        failure_index.close()
+        print_repository_metrics(raw_metrics)
+
+def parse_args(args=None):
     parser = argparse.ArgumentParser(description="Analyze GitHub Pull Requests.")
-    parser.add_argument("--mode", choices=['analyze', 'find_pull_requests', 'flush_cache'], help="Mode of operation", default='analyze')
+    parser.add_argument(
+        "--mode",
+        choices=['analyze', 'analyze_repositories', 'find_pull_requests', 'prefetch', 'flush_cache', 'migrate_cache', 'gc'],
+        help="Mode of operation",
+        default='analyze',
+    )
 
     parser.add_argument("--token", type=str, required=True, help="GitHub API token")
     parser.add_argument(
@@ -413,45 +1341,289 @@ def main():
         type=int,
         default=PAGE_COUNT_LIMIT,
     )
+    parser.add_argument(
+        "--sync-pull-requests",
+        help="Keep a stored list of pull requests and only page through the ones updated since the last run",
+        action="store_true",
+    )
     parser.add_argument(
         "--non-github-delay-seconds",
-        help="Delay between requests for non-github sources",
-        type=int,
+        help="Minimum time between requests to each non-github host",
+        type=float,
         default=1,
     )
+    parser.add_argument(
+        "--host-concurrency",
+        help="Concurrent requests allowed to a host, can be repeated",
+        metavar="HOST=N",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--max-retries",
+        help="How often a request failing with a connection error, a 5xx or a rate limit is retried",
+        type=int,
+        default=4,
+    )
     parser.add_argument(
         "--github-owner",
         help="GitHub owner of the repository",
         default="opensearch-project",
     )
     parser.add_argument("--github-repo", help="GitHub repository", default="opensearch")
-    parser.add_argument("--cache-stats", help="Print cache stats after the action", action='store_true')
+    parser.add_argument(
+        "--repositories",
+        help="Repositories the analyze_repositories mode analyzes",
+        metavar="OWNER/REPO",
+        nargs="+",
+        default=[],
+    )
+    parser.add_argument(
+        "--repositories-file",
+        help="File with one OWNER/REPO per line for the analyze_repositories mode, lines starting with # are ignored",
+    )
+    parser.add_argument(
+        "--repository-workers",
+        help="Number of repositories analyzed in parallel worker processes",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--github-api-url",
+        help="GitHub REST API root, useful to point at a stub server",
+        default=GITHUB_API_URL,
+    )
+    parser.add_argument(
+        "--data-source",
+        choices=["rest", "graphql"],
+        help="Fetch comments and events one REST call per pull request, or batched in GraphQL queries",
+        default="rest",
+    )
+    parser.add_argument(
+        "--github-graphql-url",
+        help="GitHub GraphQL endpoint, useful to point at a stub server",
+        default=github_graphql.GRAPHQL_URL,
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="Number of requests fetched in parallel while warming the cache",
+        type=int,
+        default=CONCURRENCY,
+    )
+    parser.add_argument(
+        "--sequential",
+        help="List every pull request, then warm the cache, then calculate the metrics, instead of overlapping them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        help="Pull requests being fetched and extracted at once while listing continues, 4 per --concurrency by default",
+        type=int,
+    )
+    parser.add_argument(
+        "--prefetch-journal",
+        help="File the prefetch mode checkpoints the pull requests it has cached in, to resume from on the next run",
+        default=PrefetchJournal.STORE_PATH,
+    )
+    parser.add_argument(
+        "--time-budget-minutes",
+        help=f"Stop starting new pull requests in the prefetch mode after this many minutes, it then exits with status {PREFETCH_INCOMPLETE_EXIT_STATUS}",
+        type=float,
+    )
+    parser.add_argument(
+        "--holidays-file",
+        help="File with one YYYY-MM-DD date per line that are not counted as business days",
+    )
+    parser.add_argument(
+        "--metrics-store",
+        help="SQLite file the per pull request metrics are kept in between runs",
+        default=MetricsStore.STORE_PATH,
+    )
+    parser.add_argument(
+        "--history-store",
+        help=f"SQLite file the reports of the run are appended to as a snapshot, for instance {HistoryStore.STORE_PATH}",
+    )
+    parser.add_argument(
+        "--snapshot-date",
+        help="Date the reports are stored under in the history store, YYYYMMDD, today by default",
+        default=datetime.now().strftime("%Y%m%d"),
+    )
+    parser.add_argument(
+        "--test-failure-index",
+        help="SQLite file indexing which tests failed in which pull requests and builds, kept between runs",
+        default=TestFailureIndex.STORE_PATH,
+    )
+    parser.add_argument(
+        "--failure-window-days",
+        help="How many days back test failures count towards the top test failures report",
+        type=int,
+        default=FAILURE_WINDOW_DAYS,
+    )
+    parser.add_argument(
+        "--recompute-metrics",
+        help="Recompute the metrics of every pull request instead of reusing stored ones",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-backend",
+        choices=sorted(STORE_BACKENDS),
+        help="How cached responses are stored, migrate_cache moves existing per-file entries into this backend",
+        default="files",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        help="Size budget of the cache for the gc mode, the oldest entries are deleted until it fits",
+        type=int,
+    )
+    parser.add_argument("--cache-stats", help="Log cache stats after the action", action='store_true')
+    parser.add_argument(
+        "--cache-memory-entries",
+        help="Number of cached responses kept decoded in memory, 0 disables the memory tier",
+        type=int,
+        default=RequestCache.MEMORY_MAX_ENTRIES,
+    )
+    parser.add_argument(
+        "--cache-memory-mb",
+        help="Upper bound in megabytes for cached responses kept decoded in memory",
+        type=int,
+        default=RequestCache.MEMORY_MAX_BYTES // (1024 * 1024),
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Least severe messages that are logged, DEBUG logs every request and cache lookup",
+        default="INFO",
+    )
+    parser.add_argument(
+        "--telemetry-output",
+        help="File the stage timings, request latencies and cache hit ratios of the run are written to",
+    )
+    parser.add_argument(
+        "--telemetry-format",
+        choices=["json", "prometheus"],
+        help="Format of the telemetry file, prometheus writes a textfile for the node exporter",
+        default="json",
+    )
+    return parser.parse_args(args)
 
 
-    global ARGS
-    ARGS = parser.parse_args()
+def configure(args):
+    """
+    Make the parsed arguments the ones the module works with and set up the session and scheduler for them.
+    """
+    global ARGS, SESSION, SCHEDULER, TELEMETRY, API_URL
+    ARGS = args
+    TELEMETRY = Telemetry()
+    API_URL = ARGS.github_api_url.rstrip("/")
+    SESSION = create_session(ARGS.concurrency)
+    host_concurrency = {
+        host: int(limit) for host, limit in (value.split("=", 1) for value in ARGS.host_concurrency)
+    }
+    SCHEDULER = create_scheduler(
+        ARGS.concurrency,
+        ARGS.non_github_delay_seconds,
+        ARGS.max_retries,
+        host_concurrency,
+        urlparse(API_URL).netloc,
+        TELEMETRY,
+    )
 
     HEADERS["Authorization"] = f"Bearer {ARGS.token}"
 
     ARGS.token = "<HIDDEN>"
-    print(f"Arguments: {ARGS}")
 
-    cache = RequestCache()
+
+def load_repositories(args):
+    """
+    Collect the repositories to analyze from --repositories and --repositories-file, in order without duplicates.
+    """
+    repositories = list(args.repositories)
+    if args.repositories_file:
+        with open(args.repositories_file) as file:
+            repositories.extend(
+                line.strip()
+                for line in file
+                if line.strip() and not line.strip().startswith("#")
+            )
+    for repository in repositories:
+        if repository.count("/") != 1:
+            raise ValueError(f"Repository '{repository}' is not in OWNER/REPO form")
+    return list(dict.fromkeys(repositories))
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    worker_args = copy.copy(args)  # configure() hides the token, the worker processes still need it
+    configure(args)
+    logger.info("Arguments: %s", ARGS)
+
+    repository = f"{ARGS.github_owner}/{ARGS.github_repo}"
+    cache = open_cache()
+    exit_status = 0
 
     if ARGS.mode == 'analyze':
-        print("Analyzing GitHub Pull Requests...")
-        pull_requests = get_pull_requests()
-        save_pr_numbers(pull_requests)
-        pr_metrics = calculate_metrics(pull_requests, cache)
-        print_metrics(pr_metrics)
-    elif ARGS.mode == 'find_pull_requests':
-        print("Finding Pull Requests...")
-        pull_requests = get_pull_requests()
-        save_pr_numbers(pull_requests)
+        logger.info("Analyzing GitHub Pull Requests...")
+        pr_metrics, pull_requests = analyze_repository(repository, cache, ARGS.metrics_store)
+        save_pr_numbers((repository, pr["number"]) for pr in pull_requests)
+    elif ARGS.mode == 'analyze_repositories':
+        repositories = load_repositories(ARGS)
+        if not repositories:
+            raise ValueError("The analyze_repositories mode needs --repositories or --repositories-file")
+        logger.info("Analyzing %d repositories with %d workers...", len(repositories), ARGS.repository_workers)
+        analyze_repositories(repositories, worker_args, ARGS.repository_workers)
+    if ARGS.mode in ['analyze', 'analyze_repositories'] and ARGS.history_store:
+        history_store = HistoryStore(ARGS.history_store)
+        stored = history_store.append(ARGS.snapshot_date, OUTPUT_DIR)
+        history_store.close()
+        logger.info("Appended %d report rows for %s to %s", stored, ARGS.snapshot_date, ARGS.history_store)
+
+    if ARGS.mode == 'find_pull_requests':
+        logger.info("Finding Pull Requests...")
+        with TELEMETRY.stage("list"):
+            pull_requests = list_pull_requests(repository, cache)
+            save_pr_numbers((repository, pr["number"]) for pr in pull_requests)
+    elif ARGS.mode == 'prefetch':
+        logger.info("Prefetching Pull Request data...")
+        if prefetch_repository(repository, cache):
+            exit_status = PREFETCH_INCOMPLETE_EXIT_STATUS
+    elif ARGS.mode == 'migrate_cache':
+        if ARGS.cache_backend == "files":
+            logger.info("Cache entries are already stored as files, pass --cache-backend to migrate them")
+        else:
+            migrated = migrate_store(FileStore(RequestCache.CACHE_DIR), cache.store)
+            logger.info("Migrated %d cache entries into the %s backend", migrated, ARGS.cache_backend)
+    elif ARGS.mode == 'gc':
+        logger.info("Collecting cache garbage...")
+        keep_pull_requests = load_pr_numbers(repository)
+        if keep_pull_requests is None:
+            logger.info("No %spr_numbers.txt found, keeping entries of every pull request", OUTPUT_DIR)
+        keep_urls = pull_request_urls(keep_pull_requests) if keep_pull_requests is not None else None
+        max_bytes = ARGS.cache_max_mb * 1024 * 1024 if ARGS.cache_max_mb is not None else None
+        result = cache.collect_garbage(keep_urls, max_bytes)
+        logger.info(
+            "Deleted %d cache entries, kept %d, reclaimed %d bytes",
+            result["deleted_entries"],
+            result["remaining_entries"],
+            result["bytes_reclaimed"],
+        )
+    elif ARGS.mode == 'flush_cache':
+        logger.info("Flushing cache...")
+        cache.clear_cache()
+        # Computed from the flushed responses, the history store keeps the reports that were already written
+        derived = [ARGS.prefetch_journal, ARGS.metrics_store, ARGS.test_failure_index]
+        derived += glob.glob(f"{glob.escape(os.path.splitext(ARGS.metrics_store)[0])}_*.sqlite")  # analyze_repositories
+        for path in derived:
+            if os.path.exists(path):
+                os.remove(path)
 
     if ARGS.cache_stats:
-        print("Cache details:")
-        print(cache.stats())
+        logger.info("Cache details: %s", cache.stats())
+    cache.store.close()
+    if ARGS.telemetry_output:
+        TELEMETRY.write(ARGS.telemetry_output, ARGS.telemetry_format)
+        logger.info("Wrote %s telemetry to %s", ARGS.telemetry_format, ARGS.telemetry_output)
+    return exit_status
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
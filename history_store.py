@@ -0,0 +1,174 @@
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+from request_cache import RequestCache
+
+# The reports print_metrics writes, each one kept in its own table with a row per report row and snapshot.
+# Report columns are mapped to table columns, columns an older report did not have are stored as NULL.
+REPORT_TABLES = {
+    "business_days_to_merge_by_week.csv": ("weekly", {
+        "type_of_contribution": "type_of_contribution",
+        "created_at": "week",
+        "number": "pull_requests",
+        "business_days_to_merge": "business_days_to_merge",
+        "number_of_commenters": "number_of_commenters",
+        "gradle_check_failures": "gradle_check_failures",
+    }),
+    "pull_requests_metrics_by_type_of_contribution.csv": ("contribution_types", {
+        "type_of_contribution": "type_of_contribution",
+        "number": "pull_requests",
+        "business_days_to_merge": "business_days_to_merge",
+        "number_of_commenters": "number_of_commenters",
+        "number_of_comments": "number_of_comments",
+    }),
+    "pull_request_metrics_by_contributor_metrics.csv": ("contributors", {
+        "type_of_contribution": "type_of_contribution",
+        "user_login": "user_login",
+        "number": "pull_requests",
+        "business_days_to_merge": "business_days_to_merge",
+        "number_of_commenters": "number_of_commenters",
+        "number_of_comments": "number_of_comments",
+        "number_of_pushes": "number_of_pushes",
+        "gradle_check_failures": "gradle_check_failures",
+    }),
+    "top_test_failures.csv": ("test_failures", {
+        "failing_tests": "failing_test",
+        "unique_pr_count": "unique_pr_count",
+        "total_fail_count": "total_fail_count",
+        "pr_numbers": "pr_numbers",
+    }),
+    "pull_requests_metrics_by_repository.csv": ("repositories", {
+        "repository": "repository",
+        "number": "pull_requests",
+        "business_days_to_merge": "business_days_to_merge",
+        "number_of_commenters": "number_of_commenters",
+        "number_of_comments": "number_of_comments",
+        "number_of_pushes": "number_of_pushes",
+        "gradle_check_failures": "gradle_check_failures",
+    }),
+}
+
+# Columns besides snapshot_date the trend queries filter on, each one gets an index
+INDEXED_COLUMNS = {
+    "weekly": ["type_of_contribution", "week"],
+    "contribution_types": ["type_of_contribution"],
+    "contributors": ["user_login"],
+    "test_failures": ["failing_test"],
+    "repositories": ["repository"],
+}
+
+TEXT_COLUMNS = {"type_of_contribution", "week", "user_login", "failing_test", "pr_numbers", "repository"}
+INTEGER_COLUMNS = {"pull_requests", "unique_pr_count", "total_fail_count"}
+
+SNAPSHOT_DIRECTORY = re.compile(r"^\d{8}$")
+
+
+def snapshot_date(value):
+    """Turn a YYYYMMDD report directory name or a YYYY-MM-DD date into the YYYY-MM-DD the store uses."""
+    return datetime.strptime(value.replace("-", ""), "%Y%m%d").strftime("%Y-%m-%d")
+
+
+def column_type(column):
+    if column in TEXT_COLUMNS:
+        return "TEXT"
+    return "INTEGER" if column in INTEGER_COLUMNS else "REAL"
+
+
+class HistoryStore(object):
+    """
+    Every daily snapshot of the reports in one SQLite file, a table per report indexed by snapshot date.
+
+    A run appends the reports it just wrote, so trends over hundreds of snapshots are a single query
+    instead of reading every reports/YYYYMMDD directory again.
+    """
+
+    STORE_PATH = RequestCache.state_path("history.sqlite")  # backfill rebuilds it when the cache does not have it
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots (snapshot_date TEXT PRIMARY KEY, appended_at TEXT NOT NULL)"
+        )
+        for table, columns in REPORT_TABLES.values():
+            definitions = ", ".join(f"{column} {column_type(column)}" for column in columns.values())
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} (snapshot_date TEXT NOT NULL, {definitions})")
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_snapshot_date ON {table} (snapshot_date)")
+            for column in INDEXED_COLUMNS[table]:
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column}, snapshot_date)"
+                )
+        self.connection.commit()
+
+
+    def snapshots(self):
+        """Return the dates of the stored snapshots, oldest first."""
+        return [row[0] for row in self.connection.execute("SELECT snapshot_date FROM snapshots ORDER BY snapshot_date")]
+
+
+    def append(self, date, report_dir):
+        """
+        Store the reports of one snapshot, replacing what was stored for the same date before.
+
+        Parameters:
+        - date: The date of the snapshot, YYYYMMDD or YYYY-MM-DD.
+        - report_dir: The directory print_metrics wrote the reports to, reports it does not hold are skipped.
+
+        Returns:
+        The number of report rows stored.
+        """
+        date = snapshot_date(date)
+        stored = 0
+        with self.connection:
+            for table, _ in REPORT_TABLES.values():
+                self.connection.execute(f"DELETE FROM {table} WHERE snapshot_date = ?", (date,))
+            for report, (table, columns) in REPORT_TABLES.items():
+                path = os.path.join(report_dir, report)
+                if not os.path.exists(path):
+                    continue
+                report_rows = pd.read_csv(path).reindex(columns=list(columns))
+                report_rows = report_rows.astype(object).where(report_rows.notnull(), None)
+                placeholders = ", ".join(["?"] * (len(columns) + 1))
+                self.connection.executemany(
+                    f"INSERT INTO {table} (snapshot_date, {', '.join(columns.values())}) VALUES ({placeholders})",
+                    ((date, *row) for row in report_rows.itertuples(index=False, name=None)),
+                )
+                stored += len(report_rows)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO snapshots (snapshot_date, appended_at) VALUES (?, ?)",
+                (date, datetime.now().isoformat(timespec="seconds")),
+            )
+        return stored
+
+
+    def backfill(self, reports_dir):
+        """
+        Append every reports/YYYYMMDD directory whose snapshot is not stored yet.
+
+        Returns:
+        The dates of the snapshots that were appended.
+        """
+        known = set(self.snapshots())
+        appended = []
+        for name in sorted(os.listdir(reports_dir)):
+            path = os.path.join(reports_dir, name)
+            if SNAPSHOT_DIRECTORY.match(name) and os.path.isdir(path) and snapshot_date(name) not in known:
+                self.append(name, path)
+                appended.append(snapshot_date(name))
+        return appended
+
+
+    def query(self, sql, params=()):
+        """Run a query against the store and return the result as a DataFrame."""
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,111 @@
+import json
+import re
+
+# Only the characters that change the nesting or string state matter to the scanner
+STRUCTURE = re.compile(rb'["\\{}\[\]]')
+
+# Objects in a testReport?tree=suites[cases[...]] response: {"suites": [{"cases": [{...case...}]}]}
+CASE_DEPTH = 5
+
+FAILED_STATUSES = ["FAILED", "REGRESSION"]
+
+# The key every test report has, matched in the raw bytes where a string value could only hold it escaped
+SUITES_KEY = re.compile(rb'"suites"\s*:\s*\[')
+
+
+def iter_objects_at_depth(chunks, depth):
+    """
+    Yield the raw bytes of every JSON object opened at the given nesting depth, without decoding the whole document.
+
+    Only one such object is buffered at a time, so memory stays bounded by the largest object instead of the document.
+
+    Parameters:
+    - chunks: Iterable of bytes making up a JSON document, split anywhere.
+    - depth: How many objects and arrays enclose the wanted objects, counting the objects themselves.
+
+    Raises ValueError once the chunks end when they were not a complete JSON object or array, like an HTML
+    error page or a body cut off mid-stream, the objects yielded before that are then not the whole document.
+    """
+    started = False  # The first byte of the document was seen
+    nesting = 0
+    in_string = False
+    escaped = False  # A backslash in a string was the last byte of the previous chunk
+    parts = None  # Pieces of the object being captured, None when not capturing
+
+    for chunk in chunks:
+        if not started:
+            stripped = chunk.lstrip()
+            if stripped:
+                if stripped[:1] not in b"{[":
+                    raise ValueError("The document is not a JSON object or array")
+                started = True
+        position = 0
+        capture_start = 0 if parts is not None else None
+        if escaped and chunk:
+            position = 1
+            escaped = False
+        while True:
+            match = STRUCTURE.search(chunk, position)
+            if match is None:
+                break
+            index = match.start()
+            character = chunk[index:index + 1]
+            position = index + 1
+            if in_string:
+                if character == b"\\":
+                    if position >= len(chunk):
+                        escaped = True
+                    position += 1
+                elif character == b'"':
+                    in_string = False
+            elif character == b'"':
+                in_string = True
+            elif character in b"{[":
+                nesting += 1
+                if character == b"{" and nesting == depth:
+                    parts = []
+                    capture_start = index
+            else:
+                if character == b"}" and nesting == depth and parts is not None:
+                    parts.append(chunk[capture_start:position])
+                    yield b"".join(parts)
+                    parts = None
+                    capture_start = None
+                nesting -= 1
+                if nesting < 0:
+                    raise ValueError("The document closes more objects and arrays than it opens")
+        if parts is not None:
+            parts.append(chunk[capture_start:])
+    if not started:
+        raise ValueError("The document is empty")
+    if nesting != 0 or in_string or escaped:
+        raise ValueError("The document ended before it was complete")
+
+
+def find_suites_key(chunks, found):
+    """
+    Pass the chunks through, setting found[0] once the suites key was seen in them.
+    """
+    tail = b""  # End of the previous chunk, the key can be split between two chunks
+    for chunk in chunks:
+        if not found[0]:
+            window = tail + chunk
+            if SUITES_KEY.search(window):
+                found[0] = True
+            tail = window[-64:]
+        yield chunk
+
+
+def failed_test_names(chunks):
+    """
+    Yield className.name of every failed case in a streamed Jenkins testReport.
+
+    Raises ValueError when the document is incomplete or is not a test report, a report always has a suites array.
+    """
+    found = [False]
+    for raw_case in iter_objects_at_depth(find_suites_key(chunks, found), CASE_DEPTH):
+        case = json.loads(raw_case)
+        if case.get("status") in FAILED_STATUSES:
+            yield f"{case['className']}.{case['name']}"
+    if not found[0]:
+        raise ValueError("The document is not a test report, it has no suites")
@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+
+from request_cache import RequestCache
+
+class MetricsStore(object):
+
+    STORE_PATH = RequestCache.state_path("metrics.sqlite")
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pr_metrics (
+                pr_number INTEGER PRIMARY KEY,
+                updated_at TEXT NOT NULL,
+                version TEXT NOT NULL,
+                record TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+
+    def load(self, version):
+        """
+        Load the stored metrics computed by the given version of the extractors.
+
+        Returns:
+        A dict from pull request number to a tuple of the updated_at the metrics were computed for and the metrics.
+        """
+        rows = self.connection.execute(
+            "SELECT pr_number, updated_at, record FROM pr_metrics WHERE version = ?",
+            (version,),
+        )
+        return {
+            pr_number: (updated_at, json.loads(record))
+            for pr_number, updated_at, record in rows
+        }
+
+
+    def save(self, version, rows):
+        """
+        Store metrics for pull requests, replacing what was stored for them before.
+
+        Parameters:
+        - version: The version of the extractors that computed the metrics.
+        - rows: Iterable of (pr_number, updated_at, metrics dict) tuples.
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO pr_metrics (pr_number, updated_at, version, record) VALUES (?, ?, ?, ?)",
+            (
+                (int(pr_number), updated_at, version, json.dumps(record))
+                for pr_number, updated_at, record in rows
+            ),
+        )
+        self.connection.commit()
+
+
+    def clear(self):
+        """Drop every stored metric so they are all computed again."""
+        self.connection.execute("DELETE FROM pr_metrics")
+        self.connection.commit()
+
+
+    def close(self):
+        self.connection.close()
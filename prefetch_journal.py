@@ -0,0 +1,65 @@
+import os
+import tempfile
+import threading
+
+from request_cache import RequestCache
+
+
+class PrefetchJournal(object):
+    """
+    Append-only checkpoint of the pull requests whose responses the prefetch mode has cached.
+
+    Every line is a key of owner/repo#number@updated_at, appended and flushed once all responses of that
+    pull request are stored, so a prefetch stopped at any point resumes with the pull requests it had not
+    finished. A pull request updated since gets a new key and is prefetched again.
+    """
+
+    STORE_PATH = RequestCache.state_path("prefetch.journal")
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                content = file.read()
+            # A line without its newline was being written when the process stopped, it does not count
+            lines = content.split(b"\n")[:-1]
+            self.completed = {line.decode("utf-8") for line in lines if line}
+        self._file = None
+        self._lock = threading.Lock()  # Workers finishing at once append whole lines
+
+    @staticmethod
+    def key(repository, pr):
+        return f"{repository}#{pr['number']}@{pr['updated_at']}"
+
+    def done(self, key):
+        return key in self.completed
+
+    def retain(self, keys):
+        """
+        Rewrite the journal with only the completed keys among keys, dropping those of pull requests that were
+        updated or are no longer listed so the journal does not grow without bound.
+        """
+        self.completed &= set(keys)
+        directory = os.path.dirname(self.path) or "."
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.path)}.", suffix=".tmp")
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            file.writelines(f"{key}\n" for key in sorted(self.completed))
+        os.replace(temporary_path, self.path)
+
+    def record(self, key):
+        """Mark a key as completed, the line is on disk when this returns."""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(f"{key}\n")
+            self._file.flush()
+            self.completed.add(key)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
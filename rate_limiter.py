@@ -0,0 +1,184 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+LOW_QUOTA_FRACTION = 0.1  # Below this share of the rate limit the remaining quota is paced until it resets
+
+
+class HostLimiter(object):
+    """
+    Token bucket and concurrency limit for the requests sent to a single host.
+
+    Once the X-RateLimit-* headers show the quota running low the remaining requests are spread until
+    it resets, and a Retry-After or an exhausted quota pauses every request to the host.
+    """
+
+    def __init__(self, rate=None, concurrency=4):
+        """
+        Parameters:
+        - rate: Requests per second allowed to the host, None for no limit.
+        - concurrency: How many requests can be in flight to the host at once.
+        """
+        self.configured_rate = rate
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def _reserve(self):
+        """Take a token, returning how long to wait before the request may be sent."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.rate is None:
+                return wait
+            self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1.0
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    @contextmanager
+    def slot(self):
+        with self._slots:
+            wait = self._reserve()
+            if wait > 0:
+                time.sleep(wait)
+            yield
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def adapt(self, response):
+        """Follow the rate limit headers of a response."""
+        headers = response.headers
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            self.pause(int(retry_after))
+
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if limit is None or remaining is None or reset is None:
+            return
+        seconds_until_reset = max(1.0, float(reset) - time.time())
+        if int(remaining) == 0:
+            self.pause(seconds_until_reset)
+            return
+        rate = self.configured_rate
+        if int(remaining) < int(limit) * LOW_QUOTA_FRACTION:
+            # Spread what is left of the quota over the time until it resets
+            quota_rate = int(remaining) / seconds_until_reset
+            rate = quota_rate if rate is None else min(rate, quota_rate)
+        with self._lock:
+            self.rate = rate
+
+
+class RequestScheduler(object):
+    """
+    Sends requests through a limiter per host and retries transient failures with jittered exponential backoff.
+    """
+
+    def __init__(self, default_rate=None, default_concurrency=4, max_retries=4, backoff_seconds=1.0, max_backoff_seconds=60.0, telemetry=None):
+        """
+        Parameters:
+        - default_rate: Requests per second allowed to hosts that were not configured, None for no limit.
+        - default_concurrency: Concurrent requests allowed to hosts that were not configured.
+        - max_retries: How often a failed request is retried before giving up.
+        - backoff_seconds: The backoff of the first retry, it doubles with every retry.
+        - max_backoff_seconds: Upper bound for the backoff between retries.
+        - telemetry: Optional Telemetry every request and retry is recorded in.
+        """
+        self.default_rate = default_rate
+        self.default_concurrency = default_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.telemetry = telemetry
+        self.host_settings = {}  # host -> (rate, concurrency)
+        self.limiters = {}
+        self._lock = threading.Lock()
+
+    def configure_host(self, host, rate=None, concurrency=None):
+        """Set the requests per second and concurrent requests allowed to a host before it is first used."""
+        self.host_settings[host] = (rate, concurrency or self.default_concurrency)
+
+    def limiter(self, host):
+        with self._lock:
+            if host not in self.limiters:
+                rate, concurrency = self.host_settings.get(host, (self.default_rate, self.default_concurrency))
+                self.limiters[host] = HostLimiter(rate, concurrency)
+            return self.limiters[host]
+
+    def backoff(self, attempt):
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+
+    @staticmethod
+    def should_retry(response):
+        if response.status_code in RETRY_STATUS_CODES:
+            return True
+        # GitHub answers primary and secondary rate limits with a 403
+        return response.status_code == 403 and (
+            "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0"
+        )
+
+    def request(self, session, method, url, **kwargs):
+        """
+        Send a request once the host allows it, retrying connection errors and retryable responses.
+
+        Returns:
+        The response, the last one received when every retry failed.
+        """
+        limiter = self.limiter(urlparse(url).netloc)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                with limiter.slot():
+                    start = time.perf_counter()
+                    try:
+                        response = session.request(method, url, **kwargs)
+                    finally:
+                        elapsed = time.perf_counter() - start
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self.record(url, error.__class__.__name__, elapsed)
+                if last_attempt:
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning("Retrying %s %s in %.1f seconds after %s", method, url, delay, error.__class__.__name__)
+                self.record_retry(url)
+                time.sleep(delay)
+                continue
+
+            self.record(url, response.status_code, elapsed)
+            limiter.adapt(response)
+            if last_attempt or not self.should_retry(response):
+                return response
+            response.close()
+            if "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0":
+                delay = 0  # The limiter is paused until the host accepts requests again
+            else:
+                delay = self.backoff(attempt)
+            logger.warning("Retrying %s %s in %.1f seconds after status %s", method, url, delay, response.status_code)
+            self.record_retry(url)
+            time.sleep(delay)
+
+    def record(self, url, status, seconds):
+        if self.telemetry is not None:
+            self.telemetry.record_request(url, status, seconds)
+
+    def record_retry(self, url):
+        if self.telemetry is not None:
+            self.telemetry.record_retry(url)
@@ -1,57 +1,390 @@
 import json
+import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from hashlib import sha256
 
+from cache_store import FileStore
+
+logger = logging.getLogger(__name__)
+
 class RequestCache(object):
 
     CACHE_DIR = ".request_cache"  # Directory to store cache files
 
+    # Default budget for the in-memory tier that sits in front of the files
+    MEMORY_MAX_ENTRIES = 2048
+    MEMORY_MAX_BYTES = 256 * 1024 * 1024
+
+    PR_KEY_PATTERN = re.compile(r"^pr_(\d+)/(.+)_([0-9a-f]{64})\.json$")
+    SYNCED_KEY_PATTERN = re.compile(r"^synced/pr_(\d+)/([0-9a-f]{64})\.json$")
+    # The first hash is of the URL without its query, the pull request's URL the page belongs to
+    VALIDATORS_KEY_PATTERN = re.compile(r"^validators/pr_(\d+)/([0-9a-f]{64})_[0-9a-f]{64}\.json$")
+    PR_URL_PATTERN = re.compile(r"/(?:issues|pulls)/(\d+)/")
+
+    # Validators hold a copy of the page body, they are dropped once they were not refreshed for this long
+    VALIDATORS_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
     SAVE_COUNT = 0
     HIT_COUNT = 0
+    MEMORY_HIT_COUNT = 0
     MISS_COUNT = 0
+    REVALIDATED_COUNT = 0
 
-    def get_cache_filename(self, pr_number, url, last_modified_time):
-        """Generate a cache filename for a given pull request number, URL, and last modified time."""
+    def __init__(self, store=None, memory_max_entries=MEMORY_MAX_ENTRIES, memory_max_bytes=MEMORY_MAX_BYTES, telemetry=None):
+        """
+        Parameters:
+        - store: Where the responses are persisted, one file per response in CACHE_DIR by default.
+        - memory_max_entries: How many decoded payloads to keep in memory, 0 disables the memory tier.
+        - memory_max_bytes: Upper bound on the serialized size of the payloads kept in memory.
+        - telemetry: Optional Telemetry the lookups are recorded in per endpoint.
+        """
+        self.store = store if store is not None else FileStore(self.CACHE_DIR)
+        self.telemetry = telemetry
+        self.memory_max_entries = memory_max_entries
+        self.memory_max_bytes = memory_max_bytes
+        self._memory = OrderedDict()  # cache key -> (payload, size in bytes), oldest first
+        self._memory_bytes = 0
+        self._lock = threading.Lock()  # Guards the memory tier and counters when fetching from worker threads
+        self._fetching = {}  # immutable cache key -> Event set once the thread fetching it is done
+
+    @classmethod
+    def state_path(cls, filename):
+        """
+        Path of a file of state built from the responses, kept in CACHE_DIR so CI persists it with them.
+        """
+        return os.path.join(cls.CACHE_DIR, filename)
+
+    def get_cache_key(self, pr_number, url, last_modified_time):
+        """Generate a cache key for a given pull request number, URL, and last modified time."""
         url_hash = sha256(url.encode("utf-8")).hexdigest()
-        # Incorporate the last modified time into the filename
-        filename = f"pr_{pr_number}/{last_modified_time}_{url_hash}.json"
-        return os.path.join(self.CACHE_DIR, filename)
+        # Incorporate the last modified time into the key
+        return f"pr_{pr_number}/{last_modified_time}_{url_hash}.json"
 
 
     def save_to_cache(self, pr_number, url, data, last_modified_time):
-        """Save data to cache with the last modified timestamp as part of the filename."""
-        if not os.path.exists(self.CACHE_DIR):
-            os.makedirs(self.CACHE_DIR)
-        cache_filename = self.get_cache_filename(pr_number, url, last_modified_time)
-        os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
-        with open(cache_filename, "w") as cache_file:
-            json.dump(data, cache_file)
-        self.SAVE_COUNT = 1 + self.SAVE_COUNT
+        """Save data to cache with the last modified timestamp as part of the key."""
+        self.store_entry(self.get_cache_key(pr_number, url, last_modified_time), url, data)
+        self.store.write(
+            self.get_synced_key(pr_number, url),
+            json.dumps({"last_modified_time": last_modified_time}).encode("utf-8"),
+        )
+
+
+    def store_entry(self, cache_key, url, data):
+        """Write data to the store and the memory tier, counting the store against the URL's endpoint."""
+        serialized = json.dumps(data).encode("utf-8")
+        self.store.write(cache_key, serialized)
+        self.remember(cache_key, data, len(serialized))
+        with self._lock:
+            self.SAVE_COUNT = 1 + self.SAVE_COUNT
+        self.record(url, "stores", len(serialized))
+
+
+    def read_entry(self, cache_key):
+        """
+        Read and decode a stored entry.
+
+        An entry that does not decode, left truncated by a run killed mid-write before writes were atomic,
+        is deleted and treated as a miss so it is fetched and stored again.
+
+        Returns:
+        A tuple of the decoded data and its serialized size, (None, 0) if nothing usable is stored.
+        """
+        serialized = self.store.read(cache_key)
+        if serialized is None:
+            return None, 0
+        try:
+            return json.loads(serialized), len(serialized)
+        except ValueError:
+            logger.warning("Deleting corrupt cache entry '%s'.", cache_key)
+            self.store.delete(cache_key)
+            return None, 0
+
+
+    def record(self, url, outcome, size=0):
+        """Count a cache outcome against the endpoint of the URL when telemetry is collected."""
+        if self.telemetry is not None:
+            self.telemetry.record_cache(url, outcome, size)
+
+
+    def get_synced_key(self, pr_number, url):
+        """Generate the key pointing at the latest snapshot saved for a pull request's URL."""
+        url_hash = sha256(url.encode("utf-8")).hexdigest()
+        return f"synced/pr_{pr_number}/{url_hash}.json"
+
+
+    def load_synced(self, pr_number, url):
+        """
+        Load the latest snapshot saved for a pull request's URL whatever its timestamp, so a refresh can
+        build on it. None if nothing was saved or the snapshot was deleted since.
+        """
+        synced, _ = self.read_entry(self.get_synced_key(pr_number, url))
+        if synced is None:
+            return None
+        return self.load_from_cache(pr_number, url, synced["last_modified_time"])
 
 
     def load_from_cache(self, pr_number, url, last_modified_time):
         """Attempt to load data from cache based on the last modified timestamp."""
-        cache_filename = self.get_cache_filename(pr_number, url, last_modified_time)
-        if os.path.exists(cache_filename):
-            with open(cache_filename, "r") as cache_file:
+        return self.lookup(self.get_cache_key(pr_number, url, last_modified_time), url)
+
+
+    def lookup(self, cache_key, url):
+        """
+        Look a cache key up in the memory tier, then in the store, counting the hit against the URL's endpoint.
+
+        Returns:
+        The cached data, None on a miss.
+        """
+        with self._lock:
+            if cache_key in self._memory:
+                self._memory.move_to_end(cache_key)
+                self.MEMORY_HIT_COUNT = 1 + self.MEMORY_HIT_COUNT
+                self.record(url, "memory_hits")
+                return self._memory[cache_key][0]
+        data, size = self.read_entry(cache_key)
+        if data is not None:
+            with self._lock:
                 self.HIT_COUNT = 1 + self.HIT_COUNT
-                return json.load(cache_file)
-        return None
+            self.record(url, "hits", size)
+            self.remember(cache_key, data, size)
+        return data
+
+
+    def contains(self, pr_number, url, last_modified_time):
+        """Check whether a response is cached without loading it."""
+        cache_key = self.get_cache_key(pr_number, url, last_modified_time)
+        with self._lock:
+            if cache_key in self._memory:
+                return True
+        return self.store.contains(cache_key)
+
+
+    def remember(self, cache_key, data, size):
+        """Keep a decoded payload in memory, evicting the least recently used ones to stay within budget."""
+        if self.memory_max_entries <= 0 or size > self.memory_max_bytes:
+            return
+        with self._lock:
+            if cache_key in self._memory:
+                self._memory_bytes -= self._memory.pop(cache_key)[1]
+            self._memory[cache_key] = (data, size)
+            self._memory_bytes += size
+            while len(self._memory) > self.memory_max_entries or self._memory_bytes > self.memory_max_bytes:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+
+    def get_immutable_key(self, url):
+        """Generate the cache key of a resource that never changes once it exists, only its URL identifies it."""
+        url_hash = sha256(url.encode("utf-8")).hexdigest()
+        return f"immutable/{url_hash}.json"
+
+
+    def fetch_immutable(self, url, fetch_function):
+        """
+        Fetch a resource that never changes from the cache or with fetch_function, it is cached without expiry
+        and shared by every pull request linking to it.
+
+        fetch_function returns None when the resource could not be fetched, that result is not cached.
+        """
+        cache_key = self.get_immutable_key(url)
+        data = self.lookup(cache_key, url)
+        if data is not None:
+            return data
+
+        # Pull requests sharing a build ask for its report at the same time, only one of them fetches it
+        with self._lock:
+            fetching = self._fetching.get(cache_key)
+            if fetching is None:
+                self._fetching[cache_key] = threading.Event()
+        if fetching is not None:
+            fetching.wait()
+            return self.fetch_immutable(url, fetch_function)  # Fetched again only when the other fetch failed
+
+        logger.debug("Fetching immutable data for URL '%s'.", url)
+        with self._lock:
+            self.MISS_COUNT = 1 + self.MISS_COUNT
+        self.record(url, "misses")
+        try:
+            data = fetch_function(url)
+            if data is not None:
+                self.store_entry(cache_key, url, data)
+        finally:
+            with self._lock:
+                self._fetching.pop(cache_key).set()
+        return data
+
+
+    def contains_immutable(self, url):
+        """Check whether a resource that never changes is cached without loading it."""
+        cache_key = self.get_immutable_key(url)
+        with self._lock:
+            if cache_key in self._memory:
+                return True
+        return self.store.contains(cache_key)
+
+
+    def get_validators_key(self, url):
+        """
+        Generate the key holding the HTTP validators and body last served for a URL, the validators of a
+        pull request's URL are kept with that pull request so garbage collection drops them together.
+        """
+        url_hash = sha256(url.encode("utf-8")).hexdigest()
+        match = self.PR_URL_PATTERN.search(url)
+        if match is not None:
+            base_url_hash = sha256(url.split("?", 1)[0].encode("utf-8")).hexdigest()
+            return f"validators/pr_{match.group(1)}/{base_url_hash}_{url_hash}.json"
+        return f"validators/{url_hash}.json"
+
+
+    def save_validators(self, url, etag, last_modified, data, next_url):
+        """Store the ETag / Last-Modified validators of a response so it can be revalidated later."""
+        record = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "next": next_url,
+            "data": data,
+        }
+        self.store.write(self.get_validators_key(url), json.dumps(record).encode("utf-8"))
+
+
+    def load_validators(self, url):
+        """Load the stored validators and body for a URL, None if the URL was never stored."""
+        return self.read_entry(self.get_validators_key(url))[0]
+
+
+    def get_pull_requests_key(self, repository):
+        """Generate the key holding the synced pull request list of an owner/repo."""
+        return f"pull_requests/{repository.replace('/', '_')}.json"
+
+
+    def save_pull_requests(self, repository, high_water_mark, pull_requests):
+        """Store the pull request list of a repository with the newest updated_at it has seen."""
+        record = {
+            "high_water_mark": high_water_mark,
+            "pull_requests": pull_requests,
+        }
+        self.store.write(self.get_pull_requests_key(repository), json.dumps(record).encode("utf-8"))
+
+
+    def load_pull_requests(self, repository):
+        """Load the stored pull request list of a repository, None if it was never synced."""
+        return self.read_entry(self.get_pull_requests_key(repository))[0]
+
+
+    def revalidated(self, url):
+        """Count a response that was served from stored validators after a 304 Not Modified."""
+        with self._lock:
+            self.REVALIDATED_COUNT = 1 + self.REVALIDATED_COUNT
+        self.record(url, "not_modified")
+
+
+    def collect_garbage(self, keep_urls=None, max_bytes=None):
+        """
+        Delete cache entries that can no longer be served and compact the store.
+
+        Validators not refreshed within VALIDATORS_MAX_AGE_SECONDS are deleted too, a page that changes
+        is stored again when it is next fetched.
+
+        Parameters:
+        - keep_urls: The per pull request URLs still being analyzed, like the comments and events URLs of every
+          pull request of every repository, entries of other pull requests' URLs are deleted. None keeps them all.
+        - max_bytes: Size budget for the remaining entries, the oldest ones are deleted until it fits.
+
+        Returns:
+        A dict with the number of deleted entries and the bytes reclaimed on disk.
+        """
+        disk_usage = self.store.disk_usage()
+        entries = list(self.store.entries())
+        expired = set()
+        keep_hashes = {sha256(url.encode("utf-8")).hexdigest() for url in keep_urls} if keep_urls is not None else None
+
+        # Only the newest snapshot of a pull request's URL can be hit again, older ones embed a stale updated_at
+        newest = {}
+        validators_cutoff = time.time() - self.VALIDATORS_MAX_AGE_SECONDS
+        for key, _, stored_at in entries:
+            if key.startswith("validators/"):
+                validators_match = self.VALIDATORS_KEY_PATTERN.match(key)
+                if stored_at < validators_cutoff or (
+                    validators_match is not None
+                    and keep_hashes is not None
+                    and validators_match.group(2) not in keep_hashes
+                ):
+                    expired.add(key)
+                continue
+            synced_match = self.SYNCED_KEY_PATTERN.match(key)
+            if synced_match is not None:
+                if keep_hashes is not None and synced_match.group(2) not in keep_hashes:
+                    expired.add(key)
+                continue
+            match = self.PR_KEY_PATTERN.match(key)
+            if match is None:
+                continue
+            pr_number, last_modified_time, url_hash = match.groups()
+            if keep_hashes is not None and url_hash not in keep_hashes:
+                expired.add(key)
+                continue
+            previous = newest.get((pr_number, url_hash))
+            if previous is None or previous[0] < last_modified_time:
+                if previous is not None:
+                    expired.add(previous[1])
+                newest[(pr_number, url_hash)] = (last_modified_time, key)
+            else:
+                expired.add(key)
+
+        if max_bytes is not None:
+            # Validators only save a download, evict them first. Immutable entries are shared by every run and
+            # pull request, evict them last
+            remaining = sorted(
+                (entry for entry in entries if entry[0] not in expired),
+                key=lambda entry: (entry[0].startswith("immutable/"), not entry[0].startswith("validators/"), entry[2]),
+            )
+            remaining_bytes = sum(size for _, size, _ in remaining)
+            for key, size, _ in remaining:
+                if remaining_bytes <= max_bytes:
+                    break
+                expired.add(key)
+                remaining_bytes -= size
+
+        for key in expired:
+            self.store.delete(key)
+        self.store.compact()
+        with self._lock:
+            for key in expired:
+                if key in self._memory:
+                    self._memory_bytes -= self._memory.pop(key)[1]
+
+        return {
+            "deleted_entries": len(expired),
+            "remaining_entries": len(entries) - len(expired),
+            "bytes_reclaimed": disk_usage - self.store.disk_usage(),
+        }
 
 
     def clear_cache(self):
         """Clear the cache contents"""
-        if os.path.exists(self.CACHE_DIR):
-            os.removedirs(self.CACHE_DIR)
+        self.store.clear()
+        self._memory.clear()
+        self._memory_bytes = 0
         self.SAVE_COUNT = 0
         self.HIT_COUNT = 0
+        self.MEMORY_HIT_COUNT = 0
         self.MISS_COUNT = 0
+        self.REVALIDATED_COUNT = 0
 
     def stats(self):
         return {
             "hits": self.HIT_COUNT,
+            "memory_hits": self.MEMORY_HIT_COUNT,
             "misses": self.MISS_COUNT,
             "stores": self.SAVE_COUNT,
+            "not_modified": self.REVALIDATED_COUNT,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
         }
 
 
@@ -59,13 +392,15 @@ class RequestCache(object):
         """Fetch PR data from GitHub API or cache, using the last modified timestamp for cache validation."""
         cache_data = self.load_from_cache(pr_number, url, last_modified_time)
         if cache_data is not None:
-            print(
-                f"Loading data from cache {self.get_cache_filename(pr_number, url, last_modified_time)} for PR #{pr_number} and URL '{url}' with timestamp {last_modified_time}."
+            logger.debug(
+                "Loading data from cache for PR #%s and URL '%s' with timestamp %s.", pr_number, url, last_modified_time
             )
             return cache_data
         else:
-            print(f"Fetching data from GitHub API for PR #{pr_number} and URL '{url}'.")
-            self.MISS_COUNT = 1 + self.MISS_COUNT
+            logger.debug("Fetching data from GitHub API for PR #%s and URL '%s'.", pr_number, url)
+            with self._lock:
+                self.MISS_COUNT = 1 + self.MISS_COUNT
+            self.record(url, "misses")
             api_data = fetch_function(
                 url
             )  # This should be an actual function to fetch data from the GitHub API
@@ -0,0 +1,142 @@
+"""
+Query the trends kept in the history store the analyzer appends every report snapshot to.
+
+    python scripts/query_history.py backfill
+    python scripts/query_history.py types --type CONTRIBUTOR --metric business_days_to_merge --since 2024-04-01
+    python scripts/query_history.py contributor reta
+    python scripts/query_history.py weeks --type CONTRIBUTOR
+"""
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_store import HistoryStore, snapshot_date  # noqa: E402
+
+TYPE_METRICS = ["pull_requests", "business_days_to_merge", "number_of_commenters", "number_of_comments"]
+CONTRIBUTOR_METRICS = TYPE_METRICS + ["number_of_pushes", "gradle_check_failures"]
+WEEKLY_METRICS = ["pull_requests", "business_days_to_merge", "number_of_commenters", "gradle_check_failures"]
+
+
+def date_range(args):
+    """SQL conditions and parameters for the --since and --until options."""
+    conditions = []
+    params = []
+    if args.since:
+        conditions.append("snapshot_date >= ?")
+        params.append(snapshot_date(args.since))
+    if args.until:
+        conditions.append("snapshot_date <= ?")
+        params.append(snapshot_date(args.until))
+    return conditions, params
+
+
+def where(conditions):
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def contribution_type_trend(store, args):
+    """One row per snapshot, one column per contribution type, holding the chosen metric."""
+    conditions, params = date_range(args)
+    if args.type:
+        conditions.append(f"type_of_contribution IN ({', '.join(['?'] * len(args.type))})")
+        params += args.type
+    rows = store.query(
+        f"SELECT snapshot_date, type_of_contribution, {args.metric} FROM contribution_types "
+        f"{where(conditions)} ORDER BY snapshot_date",
+        params,
+    )
+    return rows.pivot(index="snapshot_date", columns="type_of_contribution", values=args.metric)
+
+
+def contributor_trend(store, args):
+    """The metrics of one contributor in every snapshot they appear in."""
+    conditions, params = date_range(args)
+    conditions.insert(0, "user_login = ?")
+    params.insert(0, args.login)
+    return store.query(
+        f"SELECT snapshot_date, type_of_contribution, {', '.join(CONTRIBUTOR_METRICS)} FROM contributors "
+        f"{where(conditions)} ORDER BY snapshot_date",
+        params,
+    ).set_index("snapshot_date")
+
+
+def weekly_trend(store, args):
+    """One row per week, one column per contribution type, as the chosen snapshot reported them."""
+    snapshot = snapshot_date(args.snapshot) if args.snapshot else store.snapshots()[-1]
+    conditions = ["snapshot_date = ?"]
+    params = [snapshot]
+    if args.type:
+        conditions.append(f"type_of_contribution IN ({', '.join(['?'] * len(args.type))})")
+        params += args.type
+    rows = store.query(
+        f"SELECT week, type_of_contribution, {args.metric} FROM weekly {where(conditions)} ORDER BY week",
+        params,
+    )
+    return rows.pivot(index="week", columns="type_of_contribution", values=args.metric)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the history of the pull request reports.")
+    parser.add_argument("--store", help="The history store", default=HistoryStore.STORE_PATH)
+    parser.add_argument("--csv", help="Print the result as CSV", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill", help="Append every reports/YYYYMMDD snapshot not stored yet")
+    backfill.add_argument("--reports-dir", default="reports")
+
+    commands.add_parser("snapshots", help="List the stored snapshot dates")
+
+    types = commands.add_parser("types", help="A metric per contribution type over the snapshots")
+    types.add_argument("--type", help="Contribution type to show, can be repeated", action="append")
+    types.add_argument("--metric", choices=TYPE_METRICS, default="business_days_to_merge")
+
+    contributor = commands.add_parser("contributor", help="The metrics of a contributor over the snapshots")
+    contributor.add_argument("login")
+
+    for command in [types, contributor]:
+        command.add_argument("--since", help="First snapshot date to include, YYYY-MM-DD")
+        command.add_argument("--until", help="Last snapshot date to include, YYYY-MM-DD")
+
+    weeks = commands.add_parser("weeks", help="A metric per contribution type and week of one snapshot")
+    weeks.add_argument("--type", help="Contribution type to show, can be repeated", action="append")
+    weeks.add_argument("--metric", choices=WEEKLY_METRICS, default="business_days_to_merge")
+    weeks.add_argument("--snapshot", help="Snapshot date, the latest one by default")
+
+    args = parser.parse_args()
+
+    if args.command != "backfill" and not os.path.exists(args.store):
+        print(f"History store {args.store} does not exist, run the backfill command first.")
+        sys.exit(1)
+
+    store = HistoryStore(args.store)
+    try:
+        if args.command == "backfill":
+            appended = store.backfill(args.reports_dir)
+            print(f"Appended {len(appended)} snapshots, {len(store.snapshots())} stored in {args.store}")
+            return
+        if args.command == "snapshots":
+            for date in store.snapshots():
+                print(date)
+            return
+        if args.command == "types":
+            result = contribution_type_trend(store, args)
+        elif args.command == "contributor":
+            result = contributor_trend(store, args)
+        else:
+            result = weekly_trend(store, args)
+    finally:
+        store.close()
+
+    if args.csv:
+        print(result.to_csv(), end="")
+    else:
+        with pd.option_context("display.float_format", "{:,.2f}".format):
+            print(result.to_string())
+
+
+if __name__ == "__main__":
+    main()
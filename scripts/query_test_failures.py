@@ -0,0 +1,82 @@
+"""
+Query the index of failing tests the analyzer keeps up to date on every run.
+
+    python scripts/query_test_failures.py top --days 7
+    python scripts/query_test_failures.py top --since 2024-06-01 --until 2024-06-30 --limit 50
+    python scripts/query_test_failures.py seen org.opensearch.cluster.coordination.AwarenessAttributeDecommissionIT.testConcurrentDecommissionAction
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_failure_index import TestFailureIndex  # noqa: E402
+
+
+def timestamp(date, end_of_day=False):
+    """Turn a YYYY-MM-DD date into the failure time format of the index."""
+    return f"{date}T23:59:59Z" if end_of_day else f"{date}T00:00:00Z"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query which tests failed in which pull requests.")
+    parser.add_argument("--index", help="The test failure index", default=TestFailureIndex.STORE_PATH)
+    parser.add_argument("--repository", help="Only count failures of this owner/repo, can be repeated", action="append")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    top = commands.add_parser("top", help="The tests that failed in the most distinct pull requests")
+    top.add_argument("--days", help="Count the failures of this many days back from now", type=int)
+    top.add_argument("--limit", type=int, default=20)
+    top.add_argument("--min-prs", help="Leave out tests that failed in fewer pull requests", type=int, default=2)
+    top.add_argument("--csv", help="Print the result as CSV", action="store_true")
+
+    seen = commands.add_parser("seen", help="When a test failed first and last")
+    seen.add_argument("test", help="The test as Class.method")
+
+    for command in [top, seen]:
+        command.add_argument("--since", help="First day to count failures of, YYYY-MM-DD")
+        command.add_argument("--until", help="Last day to count failures of, YYYY-MM-DD")
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index):
+        print(f"Test failure index {args.index} does not exist, run the analyzer first.")
+        sys.exit(1)
+
+    since = timestamp(args.since) if args.since else None
+    until = timestamp(args.until, end_of_day=True) if args.until else None
+    if args.command == "top" and args.days is not None:
+        since = (datetime.now(timezone.utc) - timedelta(days=args.days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    index = TestFailureIndex(args.index)
+    try:
+        if args.command == "top":
+            result = index.top_tests(
+                since=since,
+                until=until,
+                limit=args.limit,
+                min_prs=args.min_prs,
+                repositories=args.repository,
+                label_repositories=True,
+            )
+            if args.csv:
+                print(result.to_csv(index=False), end="")
+            else:
+                with pd.option_context("display.max_colwidth", 120):
+                    print(result.to_string(index=False))
+        else:
+            result = index.seen(args.test, since, until, args.repository)
+            if result is None:
+                print(f"{args.test} did not fail in the window")
+                sys.exit(1)
+            print(f"first seen {result['first_seen']}, last seen {result['last_seen']}, in {result['unique_pr_count']} pull requests")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
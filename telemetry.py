@@ -0,0 +1,254 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Path patterns grouping URLs into endpoint types, the first match wins
+ENDPOINT_PATTERNS = [
+    ("pulls", re.compile(r"/pulls$")),
+    ("comments", re.compile(r"/issues/\d+/comments$")),
+    ("events", re.compile(r"/issues/\d+/events$")),
+    ("graphql", re.compile(r"/graphql$")),
+    ("test_report", re.compile(r"/testReport/api/json$")),
+]
+
+CACHE_OUTCOMES = ["memory_hits", "hits", "misses", "stores", "not_modified"]
+
+PROMETHEUS_PREFIX = "pr_analyzer"
+
+
+def endpoint_type(url):
+    """Group a URL into the kind of resource it serves, 'other' when it is not one the analyzer knows."""
+    path = urlparse(url).path
+    for name, pattern in ENDPOINT_PATTERNS:
+        if pattern.search(path):
+            return name
+    return "other"
+
+
+class Histogram(object):
+    """
+    Counts observations per bucket, with their sum, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one counts what is above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return (upper bound, observations at or below it) for every bucket, ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Telemetry(object):
+    """
+    Collects what a run spent its time on: wall time per stage, requests and their latency per host and
+    endpoint, and cache outcomes and bytes per endpoint. Safe to record from worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}  # stage -> seconds, in the order the stages started
+        self.requests = defaultdict(lambda: defaultdict(int))  # (host, endpoint) -> status -> count
+        self.retries = defaultdict(int)  # (host, endpoint) -> count
+        self.latency = defaultdict(Histogram)  # (host, endpoint) -> Histogram
+        self.cache = defaultdict(lambda: defaultdict(int))  # endpoint -> outcome or bytes_read / bytes_written -> count
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.stages.clear()
+            self.requests.clear()
+            self.retries.clear()
+            self.latency.clear()
+            self.cache.clear()
+
+    def merge(self, snapshot):
+        """
+        Add what another Telemetry recorded, given as its snapshot(), for instance one from a worker process.
+
+        Stage times of runs that overlapped add up, so they can exceed the wall time of the whole run.
+        """
+        with self._lock:
+            for name, seconds in snapshot["stages"].items():
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+            for entry in snapshot["http"]:
+                key = (entry["host"], entry["endpoint"])
+                for status, count in entry["statuses"].items():
+                    self.requests[key][status] += count
+                self.retries[key] += entry["retries"]
+                histogram = self.latency[key]
+                previous = 0
+                for index, count in enumerate(entry["latency_seconds"]["buckets"].values()):
+                    histogram.counts[index] += count - previous
+                    previous = count
+                histogram.sum += entry["latency_seconds"]["sum"]
+                histogram.count += entry["latency_seconds"]["count"]
+            for entry in snapshot["cache"]:
+                counters = self.cache[entry["endpoint"]]
+                for name in CACHE_OUTCOMES + ["bytes_read", "bytes_written"]:
+                    counters[name] += entry[name]
+
+    @contextmanager
+    def stage(self, name):
+        """Add the wall time spent in the with block to a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def record_request(self, url, status, seconds):
+        """
+        Record a request that was sent.
+
+        Parameters:
+        - url: The requested URL.
+        - status: The response status code, or the name of the error when no response was received.
+        - seconds: How long it took until the response headers arrived.
+        """
+        key = (urlparse(url).netloc, endpoint_type(url))
+        with self._lock:
+            self.requests[key][str(status)] += 1
+            self.latency[key].observe(seconds)
+
+    def record_retry(self, url):
+        key = (urlparse(url).netloc, endpoint_type(url))
+        with self._lock:
+            self.retries[key] += 1
+
+    def record_cache(self, url, outcome, size=0):
+        """
+        Record a cache lookup or write.
+
+        Parameters:
+        - url: The URL the cached response belongs to.
+        - outcome: One of CACHE_OUTCOMES.
+        - size: Bytes read from the store for hits and not_modified, bytes written for stores.
+        """
+        endpoint = endpoint_type(url)
+        with self._lock:
+            counters = self.cache[endpoint]
+            counters[outcome] += 1
+            if size:
+                counters["bytes_written" if outcome == "stores" else "bytes_read"] += size
+
+    def snapshot(self):
+        """Return everything recorded as a JSON serializable dict."""
+        with self._lock:
+            http = []
+            for (host, endpoint), statuses in sorted(self.requests.items()):
+                histogram = self.latency[(host, endpoint)]
+                http.append({
+                    "host": host,
+                    "endpoint": endpoint,
+                    "requests": sum(statuses.values()),
+                    "statuses": dict(statuses),
+                    "retries": self.retries.get((host, endpoint), 0),
+                    "latency_seconds": {
+                        "sum": histogram.sum,
+                        "count": histogram.count,
+                        "buckets": {
+                            "+Inf" if bound == float("inf") else str(bound): count
+                            for bound, count in histogram.cumulative()
+                        },
+                    },
+                })
+            cache = []
+            for endpoint, counters in sorted(self.cache.items()):
+                hits = counters["memory_hits"] + counters["hits"] + counters["not_modified"]
+                lookups = hits + counters["misses"]
+                entry = {"endpoint": endpoint}
+                entry.update((outcome, counters[outcome]) for outcome in CACHE_OUTCOMES)
+                entry["bytes_read"] = counters["bytes_read"]
+                entry["bytes_written"] = counters["bytes_written"]
+                entry["hit_ratio"] = hits / lookups if lookups else None
+                cache.append(entry)
+            return {"stages": dict(self.stages), "http": http, "cache": cache}
+
+    def to_prometheus(self):
+        """Render everything recorded in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, description):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+
+        def sample(name, labels, value):
+            rendered = ",".join(f'{label}="{label_value}"' for label, label_value in labels.items())
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{rendered}}} {value}")
+
+        metric("stage_seconds", "gauge", "Wall time spent in each stage of the run.")
+        for stage, seconds in snapshot["stages"].items():
+            sample("stage_seconds", {"stage": stage}, seconds)
+
+        metric("http_requests_total", "counter", "Requests sent per host, endpoint and response status.")
+        for entry in snapshot["http"]:
+            for status, count in sorted(entry["statuses"].items()):
+                sample("http_requests_total", {"host": entry["host"], "endpoint": entry["endpoint"], "status": status}, count)
+
+        metric("http_retries_total", "counter", "Requests retried per host and endpoint.")
+        for entry in snapshot["http"]:
+            sample("http_retries_total", {"host": entry["host"], "endpoint": entry["endpoint"]}, entry["retries"])
+
+        metric("http_request_duration_seconds", "histogram", "Time until the response headers arrived.")
+        for entry in snapshot["http"]:
+            labels = {"host": entry["host"], "endpoint": entry["endpoint"]}
+            for bound, count in entry["latency_seconds"]["buckets"].items():
+                sample("http_request_duration_seconds_bucket", dict(labels, le=bound), count)
+            sample("http_request_duration_seconds_sum", labels, entry["latency_seconds"]["sum"])
+            sample("http_request_duration_seconds_count", labels, entry["latency_seconds"]["count"])
+
+        metric("cache_lookups_total", "counter", "Cache lookups and writes per endpoint and outcome.")
+        for entry in snapshot["cache"]:
+            for outcome in CACHE_OUTCOMES:
+                sample("cache_lookups_total", {"endpoint": entry["endpoint"], "outcome": outcome}, entry[outcome])
+
+        metric("cache_bytes_total", "counter", "Bytes read from and written to the cache store per endpoint.")
+        for entry in snapshot["cache"]:
+            sample("cache_bytes_total", {"endpoint": entry["endpoint"], "direction": "read"}, entry["bytes_read"])
+            sample("cache_bytes_total", {"endpoint": entry["endpoint"], "direction": "written"}, entry["bytes_written"])
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, output_format="json"):
+        """
+        Write everything recorded to a file, replacing it at once so a collector never reads half a file.
+
+        Parameters:
+        - path: The file to write.
+        - output_format: 'json' or 'prometheus' for the node exporter textfile collector.
+        """
+        content = self.to_prometheus() if output_format == "prometheus" else json.dumps(self.snapshot(), indent=2) + "\n"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as file:
+            file.write(content)
+        os.replace(temporary_path, path)
@@ -0,0 +1,208 @@
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+from request_cache import RequestCache
+
+
+class TestFailureIndex(object):
+    """
+    Inverted index from failing test to the pull requests, builds and times it failed in.
+
+    Test names are interned to integer ids, every failure is a row of (test id, repository, pull request,
+    build URL, time). Pull requests are re-indexed only when their updated_at changed, so a run only
+    touches the pull requests whose metrics it computed again.
+    """
+
+    STORE_PATH = RequestCache.state_path("test_failures.sqlite")
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path) if path != ":memory:" else ""
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Worker processes analyzing other repositories write to the same file
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tests (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS failures (
+                test_id INTEGER NOT NULL,
+                repository TEXT NOT NULL,
+                pr_number INTEGER NOT NULL,
+                build_url TEXT NOT NULL,
+                failed_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS failures_failed_at ON failures (failed_at, test_id);
+            CREATE INDEX IF NOT EXISTS failures_test ON failures (test_id, failed_at);
+            CREATE INDEX IF NOT EXISTS failures_pull_request ON failures (repository, pr_number);
+            CREATE TABLE IF NOT EXISTS indexed_pull_requests (
+                repository TEXT NOT NULL,
+                pr_number INTEGER NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (repository, pr_number)
+            );
+            """
+        )
+        self.connection.commit()
+
+
+    def intern(self, names):
+        """
+        Return the ids of test names, adding the names not known yet.
+
+        Returns:
+        A dict from test name to id.
+        """
+        names = set(names)
+        self.connection.executemany("INSERT OR IGNORE INTO tests (name) VALUES (?)", ((name,) for name in names))
+        ids = {}
+        for name in names:
+            ids[name] = self.connection.execute("SELECT id FROM tests WHERE name = ?", (name,)).fetchone()[0]
+        return ids
+
+
+    def update(self, pr_metrics, repository=""):
+        """
+        Index the failing test builds of pull requests whose updated_at changed since they were indexed.
+
+        Parameters:
+        - pr_metrics: Per pull request metrics with number, updated_at and failing_test_builds columns,
+          and a repository column when they span repositories. Rows flagged in an incomplete column miss
+          test reports and are not indexed, so they are indexed once their reports can be fetched.
+        - repository: The owner/repo of the pull requests when there is no repository column.
+
+        Returns:
+        The number of pull requests indexed again.
+        """
+        repositories = pr_metrics["repository"] if "repository" in pr_metrics.columns else [repository] * len(pr_metrics)
+        incomplete = pr_metrics["incomplete"] if "incomplete" in pr_metrics.columns else [False] * len(pr_metrics)
+        indexed = {
+            (row_repository, pr_number): updated_at
+            for row_repository, pr_number, updated_at in self.connection.execute(
+                "SELECT repository, pr_number, updated_at FROM indexed_pull_requests"
+            )
+        }
+        changed = [
+            (row_repository, int(pr_number), updated_at, builds)
+            for row_repository, pr_number, updated_at, builds, row_incomplete in zip(
+                repositories, pr_metrics["number"], pr_metrics["updated_at"], pr_metrics["failing_test_builds"], incomplete
+            )
+            if isinstance(builds, list) and not row_incomplete and indexed.get((row_repository, int(pr_number))) != updated_at
+        ]
+        with self.connection:
+            ids = self.intern(test for _, _, _, builds in changed for test, _, _ in builds)
+            self.connection.executemany(
+                "DELETE FROM failures WHERE repository = ? AND pr_number = ?",
+                ((row_repository, pr_number) for row_repository, pr_number, _, _ in changed),
+            )
+            self.connection.executemany(
+                "INSERT INTO failures (test_id, repository, pr_number, build_url, failed_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (ids[test], row_repository, pr_number, build_url, failed_at)
+                    for row_repository, pr_number, _, builds in changed
+                    for test, build_url, failed_at in builds
+                ),
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO indexed_pull_requests (repository, pr_number, updated_at) VALUES (?, ?, ?)",
+                ((row_repository, pr_number, updated_at) for row_repository, pr_number, updated_at, _ in changed),
+            )
+        return len(changed)
+
+
+    def top_tests(self, since=None, until=None, limit=20, min_prs=2, repositories=None, label_repositories=False):
+        """
+        Find the tests that failed in the most distinct pull requests within a time window.
+
+        Parameters:
+        - since: Earliest failure time to count, an ISO 8601 UTC string like 2024-06-01T00:00:00Z, None for no bound.
+        - until: Latest failure time to count, None for no bound.
+        - limit: How many tests to return.
+        - min_prs: Tests that failed in fewer distinct pull requests are left out.
+        - repositories: Only count the failures of these owner/repo repositories, None for all of them.
+        - label_repositories: List pull requests as owner/repo#number instead of #number.
+
+        Returns:
+        A DataFrame with failing_tests, unique_pr_count, total_fail_count, first_seen, last_seen and pr_numbers.
+        """
+        conditions, params = self._window(since, until, repositories)
+        label = "failures.repository || '#' || failures.pr_number" if label_repositories else "'#' || failures.pr_number"
+        rows = self.connection.execute(
+            f"""
+            SELECT tests.name,
+                   COUNT(DISTINCT failures.repository || '#' || failures.pr_number) AS unique_pr_count,
+                   COUNT(*) AS total_fail_count,
+                   MIN(failures.failed_at),
+                   MAX(failures.failed_at),
+                   json_group_array(DISTINCT {label})
+            FROM failures JOIN tests ON tests.id = failures.test_id
+            {conditions}
+            GROUP BY failures.test_id
+            HAVING unique_pr_count >= ?
+            ORDER BY unique_pr_count DESC, tests.name
+            LIMIT ?
+            """,
+            params + [min_prs, limit],
+        ).fetchall()
+        return pd.DataFrame(
+            [
+                (name, unique_pr_count, total_fail_count, first_seen, last_seen, sorted(json.loads(pr_numbers)))
+                for name, unique_pr_count, total_fail_count, first_seen, last_seen, pr_numbers in rows
+            ],
+            columns=["failing_tests", "unique_pr_count", "total_fail_count", "first_seen", "last_seen", "pr_numbers"],
+        )
+
+
+    def seen(self, test, since=None, until=None, repositories=None):
+        """
+        Return a dict with the first_seen and last_seen failure times of a test and its unique_pr_count,
+        None when it did not fail within the window.
+        """
+        conditions, params = self._window(since, until, repositories)
+        conditions += " AND" if conditions else "WHERE"
+        row = self.connection.execute(
+            f"""
+            SELECT MIN(failures.failed_at), MAX(failures.failed_at),
+                   COUNT(DISTINCT failures.repository || '#' || failures.pr_number)
+            FROM failures JOIN tests ON tests.id = failures.test_id
+            {conditions} tests.name = ?
+            """,
+            params + [test],
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return {"first_seen": row[0], "last_seen": row[1], "unique_pr_count": row[2]}
+
+
+    @staticmethod
+    def _window(since, until, repositories):
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append("failures.failed_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("failures.failed_at <= ?")
+            params.append(until)
+        if repositories is not None:
+            conditions.append(f"failures.repository IN ({', '.join(['?'] * len(repositories))})")
+            params += list(repositories)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+    def clear(self, repository=None):
+        """Forget the indexed failures of a repository, or of every one, so its pull requests are indexed again."""
+        condition, params = ("WHERE repository = ?", (repository,)) if repository is not None else ("", ())
+        with self.connection:
+            self.connection.execute(f"DELETE FROM failures {condition}", params)
+            self.connection.execute(f"DELETE FROM indexed_pull_requests {condition}", params)
+
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+
+import pytest
+
+from cache_store import FileStore, PackStore, SqliteStore
+
+
+def test_pack_store_reads_entries_after_reopening(tmp_path):
+    store = PackStore(str(tmp_path))
+    store.write("pr_1/a.json", b"first")
+    store.write("pr_2/b.json", b"second")
+    store.write("pr_1/a.json", b"replaced")
+    store.delete("pr_2/b.json")
+    store.close()
+
+    store = PackStore(str(tmp_path))
+    assert store.read("pr_1/a.json") == b"replaced"
+    assert store.read("pr_2/b.json") is None
+    assert sorted(store.keys()) == ["pr_1/a.json"]
+    store.close()
+
+
+def test_pack_store_drops_a_torn_index_entry(tmp_path):
+    store = PackStore(str(tmp_path))
+    store.write("pr_1/a.json", b"kept")
+    store.close()
+    index_size = os.path.getsize(store.index_path)
+    with open(store.index_path, "ab") as index:
+        index.write(b"\x01" * (PackStore.INDEX_ENTRY.size // 2))
+
+    store = PackStore(str(tmp_path))
+    assert os.path.getsize(store.index_path) == index_size
+    assert store.read("pr_1/a.json") == b"kept"
+    store.write("pr_2/b.json", b"appended")
+    store.close()
+
+    store = PackStore(str(tmp_path))
+    assert store.read("pr_2/b.json") == b"appended"
+    store.close()
+
+
+def test_pack_store_drops_an_entry_whose_record_was_not_written(tmp_path):
+    store = PackStore(str(tmp_path))
+    store.write("pr_1/a.json", b"kept")
+    store.write("pr_2/b.json", b"torn" * 100)
+    store.close()
+    with open(store.data_path, "r+b") as data:
+        data.truncate(os.path.getsize(store.data_path) - 10)
+
+    store = PackStore(str(tmp_path))
+    assert store.read("pr_1/a.json") == b"kept"
+    assert store.read("pr_2/b.json") is None
+    assert os.path.getsize(store.index_path) == PackStore.INDEX_HEADER.size + PackStore.INDEX_ENTRY.size
+    store.close()
+
+
+def test_pack_store_compact_keeps_live_entries(tmp_path):
+    store = PackStore(str(tmp_path))
+    store.write("pr_1/a.json", b"old" * 1000)
+    store.write("pr_1/a.json", b"new")
+    store.write("pr_2/b.json", b"deleted")
+    store.delete("pr_2/b.json")
+    size = store.disk_usage()
+    store.compact()
+    assert store.disk_usage() < size
+    assert store.read("pr_1/a.json") == b"new"
+    store.close()
+
+    store = PackStore(str(tmp_path))
+    assert list(store.keys()) == ["pr_1/a.json"]
+    store.close()
+
+
+def test_pack_store_refuses_another_index_version(tmp_path):
+    PackStore(str(tmp_path)).close()
+    index_path = os.path.join(str(tmp_path), PackStore.INDEX_FILENAME)
+    with open(index_path, "r+b") as index:
+        index.write(PackStore.INDEX_HEADER.pack(PackStore.INDEX_MAGIC, PackStore.INDEX_VERSION + 1))
+    with pytest.raises(ValueError):
+        PackStore(str(tmp_path))
+
+
+def test_sqlite_store_refuses_another_schema_version(tmp_path):
+    SqliteStore(str(tmp_path)).close()
+    connection = sqlite3.connect(os.path.join(str(tmp_path), SqliteStore.FILENAME))
+    connection.execute(f"PRAGMA user_version = {SqliteStore.SCHEMA_VERSION + 1}")
+    connection.close()
+    with pytest.raises(ValueError):
+        SqliteStore(str(tmp_path))
+
+
+@pytest.mark.parametrize("store_class", [FileStore, PackStore, SqliteStore])
+def test_stores_clear_every_entry(tmp_path, store_class):
+    store = store_class(str(tmp_path))
+    store.write("pr_1/a.json", b"a")
+    store.write("immutable/b.json", b"b")
+    store.clear()
+    assert list(store.keys()) == []
+    assert store.read("pr_1/a.json") is None
+    store.close()
@@ -0,0 +1,75 @@
+import json
+import random
+
+import pytest
+
+import jenkins_reports
+
+
+def report(cases):
+    return json.dumps({"_class": "hudson.tasks.junit.TestResult", "suites": [{"cases": cases}]}).encode("utf-8")
+
+
+CASES = [
+    {"className": "org.A", "name": "passes", "status": "PASSED"},
+    {"className": "org.A", "name": "fails", "status": "FAILED"},
+    # Escaped quotes, backslashes and brackets in strings must not change the nesting
+    {"className": "org.B\\\"}]{[", "name": "quote \" and backslash \\", "status": "REGRESSION"},
+    {"className": "org.C", "name": "unicode é \\u0041", "status": "FIXED"},
+    {"className": "org.D", "name": "\\", "status": "FAILED"},
+]
+EXPECTED = [f"{case['className']}.{case['name']}" for case in CASES if case["status"] in ["FAILED", "REGRESSION"]]
+
+
+def random_chunks(data, rng):
+    """Split data at random positions, empty chunks included."""
+    cuts = sorted(rng.randint(0, len(data)) for _ in range(rng.randint(0, 20)))
+    return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+
+def test_failed_test_names_of_a_whole_document():
+    assert list(jenkins_reports.failed_test_names([report(CASES)])) == EXPECTED
+
+
+def test_failed_test_names_with_random_chunk_splits():
+    data = report(CASES)
+    rng = random.Random(0)
+    for _ in range(500):
+        assert list(jenkins_reports.failed_test_names(random_chunks(data, rng))) == EXPECTED
+
+
+def test_failed_test_names_split_after_every_byte():
+    data = report(CASES)
+    chunks = [data[index:index + 1] for index in range(len(data))]
+    assert list(jenkins_reports.failed_test_names(chunks)) == EXPECTED
+
+
+def test_iter_objects_at_depth_yields_the_raw_objects():
+    objects = [json.loads(raw) for raw in jenkins_reports.iter_objects_at_depth([report(CASES)], jenkins_reports.CASE_DEPTH)]
+    assert objects == CASES
+
+
+def test_truncated_document_raises():
+    data = report(CASES)
+    for size in range(len(data)):
+        with pytest.raises(ValueError):
+            list(jenkins_reports.failed_test_names([data[:size]]))
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"",
+        b"  \n",
+        b"<html><body>Sign in {to Jenkins}</body></html>",
+        b'{"error": "not found"}',
+        b'{"suites": []}}',
+    ],
+)
+def test_document_that_is_not_a_report_raises(body):
+    with pytest.raises(ValueError):
+        list(jenkins_reports.failed_test_names([body]))
+
+
+def test_report_without_cases_has_no_failures():
+    assert list(jenkins_reports.failed_test_names([b' {"suites": [] } '])) == []
@@ -0,0 +1,72 @@
+import os
+import time
+
+from cache_store import FileStore, PackStore
+from request_cache import RequestCache
+
+COMMENTS_URL = "https://api.github.com/repos/owner/repo/issues/1/comments"
+EVENTS_URL = "https://api.github.com/repos/owner/repo/issues/1/events"
+OTHER_REPOSITORY_URL = "https://api.github.com/repos/owner/other/issues/1/comments"
+REPORT_URL = "https://build.ci.opensearch.org/job/gradle-check/1/testReport/api/json"
+
+
+def file_cache(tmp_path):
+    return RequestCache(store=FileStore(str(tmp_path)), memory_max_entries=0)
+
+
+def test_gc_keeps_only_the_newest_snapshot_of_a_url(tmp_path):
+    cache = file_cache(tmp_path)
+    cache.save_to_cache(1, COMMENTS_URL, ["old"], "2024-01-01T00:00:00Z")
+    cache.save_to_cache(1, COMMENTS_URL, ["new"], "2024-02-01T00:00:00Z")
+
+    result = cache.collect_garbage()
+
+    assert result["deleted_entries"] == 1
+    assert not cache.store.contains(cache.get_cache_key(1, COMMENTS_URL, "2024-01-01T00:00:00Z"))
+    assert cache.load_from_cache(1, COMMENTS_URL, "2024-02-01T00:00:00Z") == ["new"]
+
+
+def test_gc_deletes_the_entries_of_urls_not_kept(tmp_path):
+    cache = file_cache(tmp_path)
+    cache.save_to_cache(1, COMMENTS_URL, ["kept"], "2024-01-01T00:00:00Z")
+    # The same pull request number in another repository is a different URL
+    cache.save_to_cache(1, OTHER_REPOSITORY_URL, ["dropped"], "2024-01-01T00:00:00Z")
+    cache.save_validators(f"{OTHER_REPOSITORY_URL}?per_page=100", '"etag"', None, ["dropped"], None)
+    cache.store_entry(cache.get_immutable_key(REPORT_URL), REPORT_URL, ["org.A.fails"])
+
+    cache.collect_garbage(keep_urls=[COMMENTS_URL, EVENTS_URL])
+
+    assert cache.load_from_cache(1, COMMENTS_URL, "2024-01-01T00:00:00Z") == ["kept"]
+    assert cache.load_synced(1, COMMENTS_URL) == ["kept"]
+    assert cache.load_synced(1, OTHER_REPOSITORY_URL) is None
+    assert cache.load_validators(f"{OTHER_REPOSITORY_URL}?per_page=100") is None
+    assert cache.store.contains(cache.get_immutable_key(REPORT_URL))
+
+
+def test_gc_expires_validators_not_refreshed(tmp_path):
+    cache = file_cache(tmp_path)
+    cache.save_validators(f"{COMMENTS_URL}?per_page=100", '"stale"', None, [], None)
+    cache.save_validators(f"{EVENTS_URL}?per_page=100", '"fresh"', None, [], None)
+    stale = time.time() - RequestCache.VALIDATORS_MAX_AGE_SECONDS - 60
+    os.utime(cache.store.path(cache.get_validators_key(f"{COMMENTS_URL}?per_page=100")), (stale, stale))
+
+    cache.collect_garbage(keep_urls=[COMMENTS_URL, EVENTS_URL])
+
+    assert cache.load_validators(f"{COMMENTS_URL}?per_page=100") is None
+    assert cache.load_validators(f"{EVENTS_URL}?per_page=100")["etag"] == '"fresh"'
+
+
+def test_gc_evicts_validators_first_and_immutable_entries_last(tmp_path):
+    cache = RequestCache(store=PackStore(str(tmp_path)), memory_max_entries=0)
+    cache.store_entry(cache.get_immutable_key(REPORT_URL), REPORT_URL, ["x" * 1000])
+    cache.save_to_cache(1, COMMENTS_URL, ["y" * 1000], "2024-01-01T00:00:00Z")
+    cache.save_validators(f"{EVENTS_URL}?per_page=100", '"etag"', None, ["z" * 1000], None)
+    sizes = {key: size for key, size, _ in cache.store.entries()}
+    validators_key = cache.get_validators_key(f"{EVENTS_URL}?per_page=100")
+
+    cache.collect_garbage(max_bytes=sum(sizes.values()) - sizes[validators_key])
+
+    assert cache.load_validators(f"{EVENTS_URL}?per_page=100") is None
+    assert cache.load_from_cache(1, COMMENTS_URL, "2024-01-01T00:00:00Z") is not None
+    assert cache.store.contains(cache.get_immutable_key(REPORT_URL))
+    cache.store.close()